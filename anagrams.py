@@ -1,8 +1,18 @@
 import argparse
-from collections import defaultdict
-from itertools import permutations
+import asyncio
+from array import array
+from collections import Counter, defaultdict
+from itertools import combinations_with_replacement, groupby, permutations, product
+import hashlib
+import json
+import math
+import mmap
 import os
-from typing import Dict, Set, List
+import stat
+import struct
+import sys
+import time
+from typing import Dict, Iterable, Iterator, Optional, Set, List, TextIO, Tuple
 
 
 def load_words(file_path) -> Set[str]:
@@ -11,24 +21,568 @@ def load_words(file_path) -> Set[str]:
     return set(words)
 
 
-def find_anagrams(letters, dictionary) -> Dict[int, List[str]]:
-    anagrams = defaultdict(list)
+def signature(word: str) -> str:
+    return ''.join(sorted(word))
+
+
+class AnagramIndex:
+    '''Dictionary words indexed by their sorted letters (signature).
+    Words that can be made from some letters are found by enumerating the
+    sub-multisets of those letters in sorted order, a branch is dropped as soon
+    as no signature starts with it.'''
+
+    def __init__(self, words: Iterable[str]) -> None:
+        self.words: Dict[str, List[str]] = defaultdict(list)
+        self.prefixes: Set[str] = set()
+        for word in words:
+            sig = signature(word)
+            self.words[sig].append(word)
+            for i in range(1, len(sig) + 1):
+                self.prefixes.add(sig[:i])
+
+    def get(self, sig: str) -> List[str]:
+        '''Returns words having given signature.'''
+        return self.words.get(sig, [])
+
+    def has_prefix(self, prefix: str) -> bool:
+        '''Checks if any signature starts with prefix.'''
+        return prefix in self.prefixes
+
+    def lookup(self, letters: str) -> Iterator[str]:
+        '''Yields every word that can be made from some of the letters.'''
+        counts = sorted(Counter(letters).items())
+
+        def walk(start, prefix):
+            yield from self.get(prefix)
+            for i in range(start, len(counts)):
+                letter, count = counts[i]
+                sig = prefix
+                for _ in range(count):
+                    sig += letter
+                    if not self.has_prefix(sig):
+                        break
+                    yield from walk(i + 1, sig)
+
+        return walk(0, '')
+
+    def trie(self) -> 'WordTrie':
+        '''Returns WordTrie of the indexed words for blank tiles and pattern queries.'''
+        return WordTrie(word for words in self.words.values() for word in words)
+
+
+class CompiledIndex(AnagramIndex):
+    '''AnagramIndex read from a file built by compile_index().
+    The file is memory-mapped and searched in place, so only the pages that
+    are touched by a lookup are read.
+
+    ### File layout
+    header: HEADER
+    signature offsets: n + 1 unsigned ints
+    word offsets: n + 1 unsigned ints
+    node letters: m unsigned ints, code point of the letter leading to each node
+    node ends: m unsigned ints, index after the last node of each subtree,
+        END_WORD is set if a word ends at the node
+    signatures: sorted utf-8 signatures, concatenated
+    words: utf-8 words of each signature separated by newline, concatenated
+
+    Nodes are the WordTrie of all words in preorder, node 0 is the root.'''
+
+    MAGIC = b'ANAG'
+    VERSION = 2
+    # magic, version, source mtime_ns, source size, source hash, signature count, node count
+    HEADER = struct.Struct('=4sIqq32sII')
+    END_WORD = 1 << 31
+
+    def __init__(self, path: str) -> None:
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, *_, n, m = self.HEADER.unpack_from(self.mm)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f'{path} is not a compiled dictionary')
+        self.n = n
+        offsets = memoryview(self.mm)[self.HEADER.size:].cast('B')
+        itemsize = array('I').itemsize
+        size = (n + 1) * itemsize
+        self.sig_offsets = offsets[:size].cast('I')
+        self.word_offsets = offsets[size:2 * size].cast('I')
+        self.node_letters = offsets[2 * size:2 * size + m * itemsize].cast('I')
+        self.node_ends = offsets[2 * size + m * itemsize:2 * size + 2 * m * itemsize].cast('I')
+        self.sigs_start = self.HEADER.size + 2 * size + 2 * m * itemsize
+        self.words_start = self.sigs_start + self.sig_offsets[n]
+
+    def _sig(self, i: int) -> bytes:
+        return self.mm[self.sigs_start + self.sig_offsets[i]:
+                       self.sigs_start + self.sig_offsets[i + 1]]
+
+    def _bisect(self, sig: bytes) -> int:
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._sig(mid) < sig:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, sig: str) -> List[str]:
+        key = sig.encode()
+        i = self._bisect(key)
+        if i == self.n or self._sig(i) != key:
+            return []
+        words = self.mm[self.words_start + self.word_offsets[i]:
+                        self.words_start + self.word_offsets[i + 1]]
+        return words.decode().split('\n')
+
+    def has_prefix(self, prefix: str) -> bool:
+        key = prefix.encode()
+        i = self._bisect(key)
+        return i < self.n and self._sig(i).startswith(key)
+
+    def trie(self) -> 'WordTrie':
+        '''Returns WordTrie that walks the nodes stored in the file.'''
+        return CompiledTrie(self.node_letters, self.node_ends, self.END_WORD)
+
+    def close(self) -> None:
+        self.sig_offsets.release()
+        self.word_offsets.release()
+        self.node_letters.release()
+        self.node_ends.release()
+        self.mm.close()
+
+
+def file_hash(file_path: str) -> bytes:
+    h = hashlib.blake2b(digest_size=32)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+def trie_nodes(words: Iterable[str], end_word: int) -> Tuple[array, array]:
+    '''Returns node letters and node ends of the preorder trie of words,
+    see CompiledIndex.'''
+    letters = array('I', [0])
+    ends = array('I', [0])
+    path = [0]  # nodes from root to the end of previous word
+    prev = ''
+    for word in sorted(words):
+        if not word:
+            continue
+        common = 0
+        while common < min(len(prev), len(word)) and prev[common] == word[common]:
+            common += 1
+        while len(path) - 1 > common:
+            node = path.pop()
+            ends[node] |= len(letters)
+        for letter in word[common:]:
+            path.append(len(letters))
+            letters.append(ord(letter))
+            ends.append(0)
+        ends[path[-1]] |= end_word
+        prev = word
+    for node in path:
+        ends[node] |= len(letters)
+    return letters, ends
+
+
+def compile_index(file_path: str, index_path: str) -> None:
+    '''Compiles word list at file_path into a CompiledIndex file.'''
+    words = load_words(file_path)
+    index = AnagramIndex(words)
+    letters, ends = trie_nodes(words, CompiledIndex.END_WORD)
+    sigs = sorted(index.words)
+    sig_offsets = array('I', [0])
+    word_offsets = array('I', [0])
+    sig_blob = bytearray()
+    word_blob = bytearray()
+    for sig in sigs:
+        sig_blob += sig.encode()
+        word_blob += '\n'.join(sorted(index.words[sig])).encode()
+        sig_offsets.append(len(sig_blob))
+        word_offsets.append(len(word_blob))
+
+    st = os.stat(file_path)
+    header = CompiledIndex.HEADER.pack(CompiledIndex.MAGIC, CompiledIndex.VERSION, st.st_mtime_ns,
+                                       st.st_size, file_hash(file_path), len(sigs), len(letters))
+    tmp_path = f'{index_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(sig_offsets.tobytes())
+            f.write(word_offsets.tobytes())
+            f.write(letters.tobytes())
+            f.write(ends.tobytes())
+            f.write(sig_blob)
+            f.write(word_blob)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def cache_index_path(file_path: str) -> str:
+    '''Returns path of the index of file_path in the user cache directory,
+    used when the index can't be written next to the word list.'''
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    key = hashlib.blake2b(os.path.abspath(file_path).encode(), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, 'anagrams', f'{os.path.basename(file_path)}-{key}.idx')
+
+
+def open_index(file_path: str, index_path: str) -> CompiledIndex:
+    '''Opens index_path, it is (re)built if it is missing or word list at
+    file_path has changed since it was built.'''
+    st = os.stat(file_path)
+    header = None
+    try:
+        with open(index_path, 'rb') as f:
+            header = CompiledIndex.HEADER.unpack(f.read(CompiledIndex.HEADER.size))
+    except (OSError, struct.error):
+        pass
+
+    if header is None or header[:2] != (CompiledIndex.MAGIC, CompiledIndex.VERSION) \
+            or header[3] != st.st_size:
+        compile_index(file_path, index_path)
+    elif header[2] != st.st_mtime_ns:
+        if header[4] != file_hash(file_path):
+            compile_index(file_path, index_path)
+        else:
+            # Only mtime has changed, record it so file is not hashed again.
+            try:
+                with open(index_path, 'r+b') as f:
+                    f.write(CompiledIndex.HEADER.pack(*header[:2], st.st_mtime_ns, *header[3:]))
+            except OSError:
+                pass  # index is still valid, it is just hashed again next time
+    return CompiledIndex(index_path)
+
+
+def load_index(file_path: str, index_path: str = None) -> AnagramIndex:
+    '''Opens compiled index of word list at file_path, see open_index.
+    @index_path: defaults to file_path + '.idx', or to cache_index_path if
+        that can't be written.
+    If no index can be written, words are indexed in memory instead.'''
+    paths = [index_path] if index_path else [file_path + '.idx', cache_index_path(file_path)]
+    for path in paths:
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            return open_index(file_path, path)
+        except OSError as e:
+            error = e
+    print(f'Warning: could not write compiled dictionary ({error}), indexing in memory.',
+          file=sys.stderr)
+    return AnagramIndex(load_words(file_path))
+
+
+def scan_words(letters: str, words, min_length: int = 3) -> Iterator[str]:
+    '''Yields words of a plain collection that can be made from some of the
+    letters, without indexing it. Permutations of the letters are looked up
+    if there are fewer of them than words, otherwise every word is checked.'''
     n = len(letters)
-    for length in range(3, n + 1):
-        words = []
-        for perm in permutations(letters, length):
-            candidate = ''.join(perm)
-            if candidate in dictionary:
-                words.append(candidate)
-        if words:
-            anagrams[length] = sorted(set(words))
-    return anagrams
+    if sum(math.perm(n, k) for k in range(min_length, n + 1)) <= len(words):
+        for k in range(min_length, n + 1):
+            for perm in permutations(letters, k):
+                candidate = ''.join(perm)
+                if candidate in words:
+                    yield candidate
+        return
+    rack = Counter(letters)
+    for word in words:
+        if min_length <= len(word) <= n and rack.keys() >= set(word) and not Counter(word) - rack:
+            yield word
+
+
+def find_anagrams(letters, dictionary) -> Dict[int, List[str]]:
+    '''@dictionary: AnagramIndex or collection of valid words. A collection is
+    searched again on every call, build an AnagramIndex (or use load_index)
+    once when answering many racks.'''
+    if isinstance(dictionary, AnagramIndex):
+        words = dictionary.lookup(letters)
+    else:
+        words = scan_words(letters, dictionary)
+    anagrams = defaultdict(set)
+    for word in words:
+        if len(word) >= 3:
+            anagrams[len(word)].add(word)
+    return {length: sorted(anagrams[length]) for length in sorted(anagrams)}
+
+
+def find_phrases(letters: str, dictionary: AnagramIndex, min_length: int = 3,
+                 limit: Optional[int] = None, timeout: Optional[float] = None) -> Iterator[str]:
+    '''Yields phrases of dictionary words that use all the letters exactly once.
+    Letters of each word are subtracted from the rack and sub-racks that can't
+    be completed are remembered, so they are not searched again. Words are
+    tried longest first so first phrases are found quickly.
+
+    ### Parameters
+    @min_length: shortest word allowed in a phrase.
+    @limit: stop after this many phrases.
+    @timeout: stop after this many seconds.'''
+    letters = letters.replace(' ', '')
+    alphabet = {letter: i for i, letter in enumerate(sorted(set(letters)))}
+
+    def vector(sig):
+        counts = [0] * len(alphabet)
+        for letter in sig:
+            counts[alphabet[letter]] += 1
+        return tuple(counts)
+
+    sigs = sorted({signature(word) for word in dictionary.lookup(letters) if len(word) >= min_length},
+                  key=lambda sig: (-len(sig), sig))
+    vectors = [vector(sig) for sig in sigs]
+    deadline = None if timeout is None else time.monotonic() + timeout
+    dead = set()
+
+    def walk(remaining, start, chosen):
+        if not any(remaining):
+            yield list(chosen)
+            return
+        if (remaining, start) in dead:
+            return
+        found = False
+        for i in range(start, len(sigs)):
+            if deadline is not None and time.monotonic() > deadline:
+                return
+            if all(a >= b for a, b in zip(remaining, vectors[i])):
+                chosen.append(i)
+                for phrase in walk(tuple(a - b for a, b in zip(remaining, vectors[i])), i, chosen):
+                    found = True
+                    yield phrase
+                chosen.pop()
+        if not found:
+            dead.add((remaining, start))
+
+    count = 0
+    for chosen in walk(vector(letters), 0, []):
+        # Same signature chosen k times gives k words without regard to order.
+        runs = [list(combinations_with_replacement(sorted(dictionary.get(sigs[i])), len(list(run))))
+                for i, run in groupby(chosen)]
+        for words in product(*runs):
+            yield ' '.join(word for run in words for word in run)
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+
+BLANK = '?'
+ANY = '*'
+_END = ''
+
+
+class WordTrie:
+    '''Prefix tree of dictionary words used for blank tiles and pattern queries.
+    Each node is a dict of letter -> child node, a node where a word ends maps
+    _END to the word. Subclasses may store nodes differently by overriding
+    _is_word and _children.'''
+
+    def __init__(self, words: Iterable[str]) -> None:
+        self.root = {}
+        for word in words:
+            node = self.root
+            for letter in word:
+                node = node.setdefault(letter, {})
+            node[_END] = word
+
+    def _is_word(self, node) -> bool:
+        return _END in node
+
+    def _children(self, node) -> Iterator:
+        '''Yields (letter, child node) of node.'''
+        return ((letter, child) for letter, child in node.items() if letter != _END)
+
+    @staticmethod
+    def _pattern_states(pattern: str, states: Set[int]) -> Set[int]:
+        '''Adds states reachable by letting ANY match nothing.'''
+        result = set(states)
+        for i in sorted(states):
+            while i < len(pattern) and pattern[i] == ANY:
+                i += 1
+                result.add(i)
+        return result
+
+    def search(self, letters: Optional[str] = None, pattern: Optional[str] = None,
+               must: str = '', min_length: int = 1, max_length: Optional[int] = None) -> Iterator[str]:
+        '''Yields words satisfying all the given constraints in a single walk of the trie.
+
+        ### Parameters
+        @letters: rack the word must be made from, BLANK matches any letter.
+            If None, words may use any letters.
+        @pattern: whole word pattern, BLANK matches one letter and ANY matches
+            zero or more letters e.g. c?t*
+        @must: letters the word has to contain.
+        @min_length, @max_length: word length limits.'''
+        rack = Counter(letters) if letters is not None else None
+        blanks = rack.pop(BLANK, 0) if rack is not None else 0
+        if rack is not None:
+            max_length = min(max_length or len(letters), len(letters))
+        required = Counter(must)
+        states = self._pattern_states(pattern, {0}) if pattern is not None else None
+
+        def walk(node, word, blanks, states, missing):
+            depth = len(word)
+            if depth >= min_length and missing == 0 and self._is_word(node) \
+                    and (states is None or len(pattern) in states):
+                yield word
+            if max_length is not None and (depth == max_length or missing > max_length - depth):
+                return
+            for letter, child in self._children(node):
+                next_states = None
+                if states is not None:
+                    next_states = set()
+                    for i in states:
+                        if i < len(pattern):
+                            if pattern[i] == ANY:
+                                next_states.add(i)
+                            elif pattern[i] in (BLANK, letter):
+                                next_states.add(i + 1)
+                    if not next_states:
+                        continue
+                    next_states = self._pattern_states(pattern, next_states)
+
+                used_blank = False
+                if rack is not None:
+                    if rack[letter] > 0:
+                        rack[letter] -= 1
+                    elif blanks > 0:
+                        used_blank = True
+                    else:
+                        continue
+                need = required[letter] > 0
+                if need:
+                    required[letter] -= 1
+                yield from walk(child, word + letter, blanks - used_blank, next_states, missing - need)
+                if need:
+                    required[letter] += 1
+                if rack is not None and not used_blank:
+                    rack[letter] += 1
+
+        return walk(self.root, '', blanks, states, sum(required.values()))
+
+
+class CompiledTrie(WordTrie):
+    '''WordTrie over the preorder node arrays of a CompiledIndex, nodes are
+    indices and children of a node are found by skipping over subtrees.'''
+
+    def __init__(self, letters, ends, end_word: int) -> None:
+        self.letters = letters
+        self.ends = ends
+        self.end_word = end_word
+        self.root = 0
+
+    def _is_word(self, node: int) -> bool:
+        return bool(self.ends[node] & self.end_word)
+
+    def _children(self, node: int) -> Iterator:
+        mask = self.end_word - 1
+        end = self.ends[node] & mask
+        child = node + 1
+        while child < end:
+            yield chr(self.letters[child]), child
+            child = self.ends[child] & mask
+
+
+def find_matches(trie: WordTrie, letters: Optional[str] = None, pattern: Optional[str] = None,
+                 must: str = '', min_length: int = 3, max_length: Optional[int] = None
+                 ) -> Dict[int, List[str]]:
+    '''Same as find_anagrams but supports blank tiles and the constraints of WordTrie.search.'''
+    matches = defaultdict(set)
+    for word in trie.search(letters, pattern, must, min_length, max_length):
+        matches[len(word)].add(word)
+    return {length: sorted(matches[length]) for length in sorted(matches)}
+
+
+def anagram_record(letters: str, dictionary) -> dict:
+    '''Returns find_anagrams result for letters as a JSON-serializable dict,
+    racks with BLANK tiles are answered by find_matches.'''
+    letters = letters.strip().lower()
+    if len(letters) < 3:
+        return {'letters': letters, 'error': 'Input must contain at least 3 letters.'}
+    if BLANK in letters:
+        trie = dictionary.trie() if isinstance(dictionary, AnagramIndex) else WordTrie(dictionary)
+        return {'letters': letters, 'anagrams': find_matches(trie, letters)}
+    return {'letters': letters, 'anagrams': find_anagrams(letters, dictionary)}
+
+
+def run_batch(dictionary, infile: TextIO, outfile: TextIO) -> None:
+    '''Answers one rack per line of infile, writes one JSON object per line to outfile.'''
+    for line in infile:
+        if not line.strip():
+            continue
+        outfile.write(json.dumps(anagram_record(line, dictionary)) + '\n')
+        outfile.flush()
+
+
+def parse_address(address: str) -> Tuple[str, str, Optional[int]]:
+    '''Returns ('tcp', host, port) or ('unix', path, None) for a --serve address.
+    tcp:HOST:PORT and unix:PATH pick the kind explicitly, otherwise HOST:PORT
+    is TCP and anything containing a path separator or no port is a Unix socket path.'''
+    kind, sep, rest = address.partition(':')
+    if sep and kind in ('tcp', 'unix'):
+        address = rest
+    elif os.sep in address or ':' not in address:
+        kind = 'unix'
+    else:
+        kind = 'tcp'
+    if kind == 'unix':
+        return kind, address, None
+    host, _, port = address.rpartition(':')
+    if not port.isdigit():
+        raise ValueError(f'Invalid TCP address {address!r}, expected HOST:PORT')
+    return kind, host, int(port)
+
+
+async def serve(dictionary, address: str) -> None:
+    '''Answers racks sent by clients using the same protocol as run_batch.
+    @address: see parse_address. An existing Unix socket at the path is
+    replaced, any other file raises FileExistsError.'''
+    kind, host, port = parse_address(address)
+    loop = asyncio.get_running_loop()
+
+    async def handle(reader, writer):
+        try:
+            while line := await reader.readline():
+                line = line.decode(errors='replace')
+                if not line.strip():
+                    continue
+                record = await loop.run_in_executor(None, anagram_record, line, dictionary)
+                writer.write(json.dumps(record).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    if kind == 'tcp':
+        server = await asyncio.start_server(handle, host, port)
+    else:
+        if os.path.lexists(host):
+            if not stat.S_ISSOCK(os.lstat(host).st_mode):
+                raise FileExistsError(f'{host} exists and is not a socket')
+            os.remove(host)
+        server = await asyncio.start_unix_server(handle, host)
+    print(f'Listening on {address}')
+    async with server:
+        await server.serve_forever()
 
 
 def main():
     parser = argparse.ArgumentParser(description='Find anagrams from a given set of letters.')
     parser.add_argument('letters', type=str, nargs='?', help='The input letters for generating anagrams')
     parser.add_argument('--file', type=str, default='dictionary.txt', help='Path to the file containing valid words')
+    parser.add_argument('--index', type=str, default=None,
+                        help='Path to the compiled dictionary, defaults to FILE.idx')
+    parser.add_argument('--batch', type=str, nargs='?', const='-', default=None,
+                        help='Read racks line by line from this file (or stdin) and print NDJSON results')
+    parser.add_argument('--serve', type=str, default=None, metavar='ADDRESS',
+                        help='Serve racks on [tcp:]HOST:PORT or [unix:]PATH of a Unix socket')
+    parser.add_argument('--pattern', type=str, default=None,
+                        help=f'Whole word pattern, {BLANK} matches one letter and {ANY} any number of letters')
+    parser.add_argument('--must', type=str, default='', help='Letters the words must contain')
+    parser.add_argument('--min', type=int, default=3, help='Minimum word length')
+    parser.add_argument('--max', type=int, default=None, help='Maximum word length')
+    parser.add_argument('--phrases', action='store_true',
+                        help='Find phrases of words that use all the letters')
+    parser.add_argument('--limit', type=int, default=100, help='Maximum number of phrases')
+    parser.add_argument('--timeout', type=float, default=10, help='Stop finding phrases after this many seconds')
 
     args = parser.parse_args()
     dict_path = args.file
@@ -40,17 +594,47 @@ def main():
     elif os.path.isdir(dict_path):
         print(f"Error: The path '{dict_path}' is not a valid file.")
         exit(1)    
+
+    if args.batch or args.serve:
+        dictionary = load_index(dict_path, args.index)
+        if args.serve:
+            try:
+                asyncio.run(serve(dictionary, args.serve))
+            except KeyboardInterrupt:
+                pass
+            except (FileExistsError, ValueError) as e:
+                print(f'Error: {e}')
+                exit(1)
+        elif args.batch == '-':
+            run_batch(dictionary, sys.stdin, sys.stdout)
+        else:
+            with open(args.batch) as f:
+                run_batch(dictionary, f, sys.stdout)
+        return
     
-    if letters is None:
-        letters = input('Enter the letters: ')
-    letters = letters.strip().lower()
-    if len(letters) < 3:
-        print(f'Error: Input must contain at least 3 letters.')
-        exit(1)
+    if args.phrases:
+        if letters is None:
+            letters = input('Enter the letters: ')
+        dictionary = load_index(dict_path, args.index)
+        for phrase in find_phrases(letters.strip().lower(), dictionary, args.min, args.limit, args.timeout):
+            print(phrase)
+        return
 
+    query = args.pattern is not None or args.must or args.min != 3 or args.max is not None
+    if letters is None and args.pattern is None:
+        letters = input('Enter the letters: ')
+    if letters is not None:
+        letters = letters.strip().lower()
+        if len(letters) < 3:
+            print(f'Error: Input must contain at least 3 letters.')
+            exit(1)
 
-    dictionary = load_words(dict_path)
-    anagrams = find_anagrams(letters, dictionary)
+    dictionary = load_index(dict_path, args.index)
+    if query or BLANK in letters:
+        pattern = args.pattern.lower() if args.pattern else None
+        anagrams = find_matches(dictionary.trie(), letters, pattern, args.must.lower(), args.min, args.max)
+    else:
+        anagrams = find_anagrams(letters, dictionary)
     for k, v in anagrams.items():
         print(f'{k} Letter Words:')
         print(' '.join(v))
@@ -1,6 +1,8 @@
 import readline
-from typing import List, Any, Iterable
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+import heapq
 import os
+import time
 
 ''' Autocompleter
 Provides easy interface to enable/disable autocompletion in terminal.
@@ -59,45 +61,347 @@ class _Utils:
         return sorted(lines)
 
     @staticmethod
-    def list_files() -> List[str]:
-        files = []
-        cwd = os.getcwd()
-        for file in os.listdir():
-            path = os.path.join(cwd, file)
-            if os.path.isfile(path):
-                files.append(path)
-        return files
+    def list_files(path: str = None) -> List[str]:
+        path = os.path.abspath(path or os.getcwd())
+        with os.scandir(path) as it:
+            return [entry.path for entry in it if entry.is_file()]
 
     @staticmethod
-    def list_dirs() -> List[str]:
-        dirs = []
-        cwd = os.getcwd()
-        for file in os.listdir():
-            path = os.path.join(cwd, file)
-            if os.path.isdir(path):
-                dirs.append(path)
-        return dirs
+    def list_dirs(path: str = None) -> List[str]:
+        path = os.path.abspath(path or os.getcwd())
+        with os.scandir(path) as it:
+            return [entry.path for entry in it if entry.is_dir()]
+
+    @staticmethod
+    def list_names(path: str, files: bool = True) -> List[str]:
+        '''Names of entries in path, directories end with a path separator.
+        @files: include files as well as directories.'''
+        with os.scandir(path) as it:
+            return [entry.name + os.sep if entry.is_dir() else entry.name
+                    for entry in it if files or entry.is_dir()]
+
+
+class Provider:
+    '''Dynamic node of an option tree, @func is called only when completion
+    reaches it and may return any option tree.
+    Results are reused for @ttl seconds, and while mtime of @watch (a path or
+    a function returning one) is unchanged. ttl of None never expires.
+
+    ### Usage
+    ac = AutoComplete({'cat': Provider.files(), 'cd': Provider.dirs()})
+    ac = AutoComplete({'kill': Provider(lambda: os.listdir('/proc'), ttl=1)})
+    '''
+
+    def __init__(self, func: Callable[[], Any], ttl: Optional[float] = 2.0,
+                 watch: Union[str, Callable[[], str], None] = None) -> None:
+        self.func = func
+        self.ttl = ttl
+        self.watch = watch
+        self._trie = None
+        self._key = None
+        self._time = 0.0
+
+    @classmethod
+    def wrap(cls, option: Any) -> 'Provider':
+        return option if isinstance(option, Provider) else cls(option)
+
+    @classmethod
+    def files(cls) -> 'Provider':
+        '''Paths of files and directories, relative to the current directory.'''
+        return _PathProvider(files=True)
+
+    @classmethod
+    def dirs(cls) -> 'Provider':
+        '''Paths of directories, relative to the current directory.'''
+        return _PathProvider(files=False)
+
+    @classmethod
+    def history(cls) -> 'Provider':
+        '''Lines entered before, as returned by readline.'''
+        return cls(lambda: [readline.get_history_item(i)
+                            for i in range(1, readline.get_current_history_length() + 1)], ttl=0)
+
+    def trie(self, typed: str = '') -> '_Trie':
+        '''Returns trie of the options.
+        @typed: text typed after the node of this provider, plain providers ignore it.'''
+        key = None
+        if self.watch is not None:
+            path = self.watch() if callable(self.watch) else self.watch
+            try:
+                key = path, os.stat(path).st_mtime_ns
+            except OSError:
+                key = path, None
+        now = time.monotonic()
+        if self._trie is None or key != self._key \
+                or (self.ttl is not None and now - self._time > self.ttl):
+            self._trie = _Trie.from_tree(self.func())
+            self._key = key
+            self._time = now
+        return self._trie
+
+
+class _PathProvider(Provider):
+    '''Completes paths in the directory of the path being typed, names of
+    each directory are listed again only when its mtime changes.'''
+    MAX_DIRS = 32
+
+    def __init__(self, files: bool = True) -> None:
+        super().__init__(_Utils.list_names, ttl=None)
+        self.files = files
+        self._tries = {}  # directory -> (mtime_ns, trie), oldest first
+
+    def trie(self, typed: str = '') -> '_Trie':
+        head = typed[:typed.rfind(os.sep) + 1]
+        path = os.path.expanduser(head) or os.curdir
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            cached = self._tries.pop(path, None)
+            if cached is None or cached[0] != mtime:
+                names = self.func(path, self.files)
+                cached = mtime, _Trie(head + name for name in names)
+        except OSError:
+            return _Trie()
+        self._tries[path] = cached
+        if len(self._tries) > self.MAX_DIRS:
+            del self._tries[next(iter(self._tries))]
+        return cached[1]
+
+
+class _Trie:
+    '''Prefix tree of completion strings, each node is a dict of char -> child
+    node, _END marks the end of a string and _PROVIDER holds a Provider whose
+    options continue from that node.'''
+    _END = ''
+    _PROVIDER = None
+
+    def __init__(self, lines: Iterable[str] = ()) -> None:
+        self.root = {}
+        for line in lines:
+            self.add(line)
+
+    def add(self, line: str, provider: Optional[Provider] = None) -> None:
+        node = self.root
+        for ch in line:
+            node = node.setdefault(ch, {})
+        if provider is None:
+            node[self._END] = {}
+        else:
+            node[self._PROVIDER] = provider
+
+    @classmethod
+    def from_tree(cls, option: Any) -> '_Trie':
+        '''Builds trie of the same strings as _Utils.tree_to_str, callables and
+        Providers in the tree are added as providers.'''
+        trie = cls()
+        trie._add_tree(option, '')
+        return trie
+
+    def _add_tree(self, option: Any, curr: str) -> None:
+        space = ' ' if curr else ''
+        if isinstance(option, Provider) or callable(option):
+            self.add(curr + space, Provider.wrap(option))
+
+        elif isinstance(option, str) or isinstance(option, int):
+            self.add(f'{curr}{space}{option}')
+
+        elif isinstance(option, list) or isinstance(option, tuple):
+            for e in option:
+                if isinstance(e, str):
+                    self.add(f'{curr}{space}{e}')
+                else:
+                    self._add_tree(e, curr)
+
+        elif isinstance(option, dict):
+            for k, v in option.items():
+                if isinstance(v, Provider) or callable(v):
+                    self._add_tree(v, curr + space + k)
+                elif not v:
+                    self.add(curr + space + k)
+                elif isinstance(v, str) or isinstance(v, int):
+                    self.add(f'{curr}{space}{k} {v}')
+                else:
+                    self._add_tree(v, curr + space + k)
+
+    def _nodes(self, prefix: str) -> Iterator[dict]:
+        '''Yields nodes reached by prefix, including nodes of providers met on the way.'''
+        node = self.root
+        for i in range(len(prefix) + 1):
+            if self._PROVIDER in node:
+                yield from node[self._PROVIDER].trie(prefix[i:])._nodes(prefix[i:])
+            if i == len(prefix):
+                yield node
+            else:
+                node = node.get(prefix[i])
+                if node is None:
+                    return
+
+    def next_words(self, prefix: str) -> Tuple[List[str], bool]:
+        '''Returns sorted first words that follow prefix in stored strings, and
+        whether a space follows prefix in any of them.
+        Only the part of the tree up to the end of those words is visited and
+        providers are called only when their node is reached.'''
+        words = set()
+        spaced = False
+
+        def walk(node, word):
+            for ch, child in node.items():
+                if ch is self._PROVIDER:
+                    if not word:
+                        words.update(child.trie().next_words('')[0])
+                elif ch == self._END or ch.isspace():
+                    if word:
+                        words.add(word)
+                    elif ch != self._END:
+                        walk(child, word)
+                else:
+                    walk(child, word + ch)
+
+        for node in self._nodes(prefix):
+            spaced = spaced or ' ' in node
+            walk(node, '')
+        return sorted(words), spaced
+
+
+def _fuzzy_score(query: str, word: str) -> Optional[float]:
+    '''Scores word for query, returns None if query is not a subsequence of word.
+    Matches at the start, after a word boundary and right after the previous
+    match score higher, shorter words are preferred on ties.'''
+    query = query.lower()
+    lowered = word.lower()
+    score = 0.0
+    pos = 0
+    prev = -2
+    for ch in query:
+        i = lowered.find(ch, pos)
+        if i == -1:
+            return None
+        score += 1
+        if i == prev + 1:
+            score += 2
+        if i == 0 or lowered[i - 1] in '-_./\\ ':
+            score += 3
+        prev = i
+        pos = i + 1
+    if lowered.startswith(query):
+        score += 10
+    return score - 0.01 * len(word)
 
 
 class AutoComplete:
-    def __init__(self, option: Any = None) -> None:
+    '''Completes input() lines from an option tree, see _Utils.tree_to_str.
+
+    ### Parameters
+    @option: option tree, may contain Providers.
+    @fuzzy: match the current word as a subsequence and rank matches instead
+        of listing every word that starts with it. Words picked from the
+        matches rank higher later, see accept_line.
+    @limit: maximum number of fuzzy matches shown.
+    '''
+
+    def __init__(self, option: Any = None, fuzzy: bool = False, limit: Optional[int] = 20) -> None:
         self.option = option
+        self.fuzzy = fuzzy
+        self.limit = limit
         self._enabled = False
         self._candidates = []
         self._shortlisted = []
         self._sr = ''
+        self._accepted = {}
+        self._offered = None  # (line before the word, fuzzy matches offered for it)
+        self._delims = None
 
     def enable(self) -> None:
         # Register our completer function
         readline.set_completer(self.complete)
         readline.parse_and_bind('tab: complete')
+        if self.fuzzy:
+            # Fuzzy matches replace the whole current word.
+            self._delims = readline.get_completer_delims()
+            readline.set_completer_delims(' \t\n')
+            readline.set_startup_hook(self._accept_submitted)
         self._enabled = True
 
     def disable(self):
         readline.set_completer(lambda *_: None)
         readline.parse_and_bind('tab: \t')
+        if self._delims is not None:
+            readline.set_completer_delims(self._delims)
+            readline.set_startup_hook(None)
+            self._delims = None
         self._enabled = False
 
+    def accept(self, word: str) -> None:
+        '''Records that word was used, fuzzy matches rank recently and
+        frequently accepted words higher.'''
+        count, _ = self._accepted.get(word, (0, 0))
+        self._accepted[word] = (count + 1, time.time())
+
+    def accept_line(self, line: str) -> None:
+        '''Records the word of a submitted line that was picked from the last
+        fuzzy matches. While enabled this is done before each new input()
+        prompt using readline's history, call it yourself if lines are not
+        added to the history.'''
+        self._accept_offered(line, True)
+        self._offered = None
+
+    def _accept_submitted(self) -> None:
+        length = readline.get_current_history_length()
+        if length and self._offered:
+            self.accept_line(readline.get_history_item(length))
+
+    def _accept_offered(self, line: str, submitted: bool) -> None:
+        '''Accepts the offered match the current word was completed to, once
+        the word is finished by a space or by submitting the line.'''
+        if not self._offered or not line.startswith(self._offered[0]):
+            return
+        word, space, _ = line[len(self._offered[0]):].partition(' ')
+        if (space or submitted) and word in self._offered[1]:
+            self.accept(word)
+            self._offered = None
+
+    def _frecency(self, word: str) -> float:
+        count, last = self._accepted.get(word, (0, 0))
+        if not count:
+            return 0.0
+        hours = (time.time() - last) / 3600
+        return 5 * count / (1 + hours)
+
+    def _fuzzy_candidates(self, line: str) -> List[str]:
+        '''Returns ranked words matching the current word of line.
+        While the user keeps typing the same word, previous matches are
+        narrowed instead of matching all the words again. The part of the word
+        up to its last path separator must match exactly, so paths are
+        matched one directory at a time.'''
+        query = line.split(' ')[-1]
+        head = query[:query.rfind(os.sep) + 1]
+        query = query[len(head):]
+        context = line[:len(line) - len(query)]
+        if self._matches and self._matches[0] == context and query.startswith(self._matches[1]):
+            pool = self._matches[2]
+        else:
+            pool, _ = self._trie.next_words(context)
+
+        scored = []
+        for word in pool:
+            score = _fuzzy_score(query, word)
+            if score is not None:
+                scored.append((score + self._frecency(head + word), word))
+        self._matches = (context, query, [word for _, word in scored])
+        ranked = heapq.nsmallest(self.limit or len(scored), scored, key=lambda m: (-m[0], m[1]))
+        return [head + word for _, word in ranked]
+
+    @property
+    def option(self) -> Any:
+        return self._option
+
+    @option.setter
+    def option(self, option: Any) -> None:
+        '''Completion trie is rebuilt on next completion, assign option again
+        after changing it in place.'''
+        self._option = option
+        self._trie = None
+        self._matches = None
+
     def toggle(self):
         self.disable() if self._enabled else self.enable()
 
@@ -106,14 +410,18 @@ class AutoComplete:
         line = readline.get_line_buffer()
         if state == 0:
             # This is the first iteration for this text, so build a match list.
-            candidates = _Utils.tree_to_str(self.option)
-            shortlisted = []
-            for candidate in candidates:
-                if candidate.startswith(line):
-                    shortlisted.append(candidate[len(line):].split()[0])
-            self._sr = ' ' if candidate[len(line):].startswith(' ') else ''
-            self._candidates = sorted(list(set(shortlisted)))
+            if self._trie is None:
+                self._trie = _Trie.from_tree(self.option)
+            if self.fuzzy:
+                self._accept_offered(line, False)
+                self._candidates = self._fuzzy_candidates(line)
+                self._offered = (line[:len(line) - len(line.split(' ')[-1])], self._candidates)
+                return self._candidates[0] if self._candidates else None
+            self._candidates, spaced = self._trie.next_words(line)
+            self._sr = ' ' if spaced else ''
 
+        if self.fuzzy:
+            return self._candidates[state] if state < len(self._candidates) else None
         try:
             out = self._candidates[state]
             out = None if out == line else out
@@ -1,57 +1,435 @@
-import curses
-import curses.ascii
-
-
-def select(stdscr, items: list):
-
-    def _draw(start_row, selected_row):
-        stdscr.erase()
-        h, w = stdscr.getmaxyx()
-        for idx, row in enumerate(items[start_row:start_row + h]):
-            x = 0  # Start from the left
-            y = idx  # Increment by 1 to move down
-            if idx + start_row == selected_row:
-                stdscr.addstr(y, x, row, curses.color_pair(1))
-            else:
-                stdscr.addstr(y, x, row)
-        stdscr.refresh()
-
-
-    curses.curs_set(0)
-    curses.init_pair(1, curses.COLOR_BLACK, curses.COLOR_WHITE)
-    stdscr.clear()
-    stdscr.refresh()
-
-    current_row = 0
-    start_row = 0
-
-    while True:
-        _draw(start_row, current_row)
-
-        key = stdscr.getch()
-        if key == curses.ascii.ESC:
-            break
-
-        elif key == curses.KEY_RESIZE:
-            h, w = stdscr.getmaxyx()
-            if current_row >= start_row + h:
-                start_row = current_row - h + 1
-
-        elif key == curses.KEY_UP and current_row > 0:
-            current_row -= 1
-            if current_row < start_row:
-                start_row -= 1  # Scroll up
-
-        elif key == curses.KEY_DOWN and current_row < len(items) - 1:
-            h, w = stdscr.getmaxyx()
-            current_row += 1
-            if current_row >= start_row + h:
-                start_row += 1  # Scroll down
-
-        elif key == curses.KEY_ENTER or key in [10, 13]:
-            return current_row
-
-if __name__ == "__main__":
-    files = ['appcompat', 'apppatch', 'AppReadiness', 'assembly', 'bcastdvr', 'bfsvc.exe', 'BitLockerDiscoveryVolumeContents', 'Boot', 'bootstat.dat', 'Branding', 'BrowserCore', 'CbsTemp', 'Containers', 'CSC', 'Cursors', 'debug', 'diagnostics', 'DiagTrack', 'DigitalLocker', 'Downloaded Program Files', 'DtcInstall.log', 'ELAMBKUP', 'en-US', 'explorer.exe', 'Fonts', 'GameBarPresenceWriter', 'Globalization', 'Help', 'HelpPaneX.exe', 'hh.exe', 'IdentityCRL', 'IME', 'ImmersiveControlPanel', 'InboxApps', 'INF', 'InputMethod', 'Installer', 'L2Schemas', 'LanguageOverlayCache', 'LiveKernelReports', 'Logs', 'lsasetup.log', 'Media', 'mib.bin', 'Microsoft.NET', 'Migration', 'ModemLogs', 'notepad.exe', 'NvContainerRecovery.bat', 'OCR', 'Offline Web Pages', 'Panther', 'Performance', 'PFRO.log', 'PLA', 'PolicyDefinitions', 'Prefetch', 'PrintDialog', 'Professional.xml', 'Provisioning', 'py.exe', 'pyshellext.amd64.dll', 'pyw.exe', 'regedit.exe', 'Registration', 'RemotePackages', 'rescache', 'Resources', 'SchCache', 'schemas', 'security', 'ServiceProfiles', 'ServiceState', 'servicing', 'Setup', 'setupact.log', 'setuperr.log', 'ShellComponents', 'ShellExperiences', 'SKB', 'SoftwareDistribution', 'Speech', 'Speech_OneCore', 'splwow64.exe', 'System', 'system.ini', 'System32', 'SystemApps', 'SystemResources', 'SystemTemp', 'SysWOW64', 'TAPI', 'Tasks', 'Temp', 'tracing', 'twain_32', 'twain_32.dll', 'UUS', 'Vss', 'WaaS', 'Web', 'win.ini', 'WindowsShell.Manifest', 'WindowsUpdate.log', 'winhlp32.exe', 'WinSxS', 'WMSysPr9.prx', 'write.exe', 'WUModels']
-    curses.wrapper(select, files)
-
+import argparse
+import curses
+import curses.ascii
+import io
+import os
+import sys
+import threading
+from itertools import count
+from typing import Iterable, List, Optional, Sequence
+
+
+class LazyItems:
+    '''Sequence view of an iterable that reads items only when they are needed.'''
+    STEP = 10000  # items read ahead at a time by read_ahead
+
+    def __init__(self, iterable: Iterable) -> None:
+        self._it = iter(iterable)
+        self._items = []
+        self._lock = threading.Lock()
+        self.done = False
+
+    def _fill(self, n: int) -> None:
+        with self._lock:
+            while not self.done and len(self._items) < n:
+                try:
+                    self._items.append(next(self._it))
+                except StopIteration:
+                    self.done = True
+
+    def has(self, index: int) -> bool:
+        self._fill(index + 1)
+        return index < len(self._items)
+
+    def __getitem__(self, index: int):
+        self._fill(index + 1)
+        return self._items[index]
+
+    @property
+    def count(self) -> int:
+        '''Number of items read so far.'''
+        return len(self._items)
+
+    def read_ahead(self) -> None:
+        '''Reads up to STEP more items, so iterables of any length never block for long.'''
+        self._fill(self.count + self.STEP)
+
+
+class StreamItems:
+    '''Sequence view of an iterable that is read on a background thread, so
+    items can be shown while the rest are still coming.
+    Items are kept in fixed size chunks, growing the buffer never copies items
+    that were already read.'''
+    CHUNK = 4096
+
+    def __init__(self, iterable: Iterable) -> None:
+        self._chunks = []
+        self._cond = threading.Condition()
+        self.count = 0
+        self.done = False
+        threading.Thread(target=self._read, args=(iterable,), daemon=True).start()
+
+    @classmethod
+    def lines(cls, file, close: bool = False) -> 'StreamItems':
+        '''Lines of a text file or pipe without their line endings.
+        @close: close file once all of it is read, by the reading thread so a
+            read that is still blocked is never interrupted.'''
+        def read():
+            try:
+                for line in file:
+                    yield line.rstrip('\r\n')
+            finally:
+                if close:
+                    file.close()
+        return cls(read())
+
+    def _read(self, iterable: Iterable) -> None:
+        try:
+            for item in iterable:
+                if not self._chunks or len(self._chunks[-1]) == self.CHUNK:
+                    self._chunks.append([])
+                self._chunks[-1].append(item)
+                self.count += 1
+                if self.count % self.CHUNK == 1:
+                    with self._cond:
+                        self._cond.notify_all()
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+
+    def wait(self, index: int, timeout: Optional[float] = None) -> bool:
+        '''Waits until item at index is read or the stream ends, returns has(index).'''
+        with self._cond:
+            self._cond.wait_for(lambda: self.done or index < self.count, timeout)
+        return self.has(index)
+
+    def has(self, index: int) -> bool:
+        return 0 <= index < self.count
+
+    def __getitem__(self, index: int):
+        if not self.has(index):
+            raise IndexError(index)
+        return self._chunks[index // self.CHUNK][index % self.CHUNK]
+
+
+def _has(items, index: int) -> bool:
+    return items.has(index) if hasattr(items, 'has') else 0 <= index < len(items)
+
+
+def _count(items) -> int:
+    '''Returns number of items available now, lazy items are not read.'''
+    return items.count if isinstance(items, (LazyItems, StreamItems)) else len(items)
+
+
+def _is_subsequence(query: str, text: str) -> bool:
+    it = iter(text)
+    return all(ch in it for ch in query)
+
+
+class _Filter:
+    '''Matches items against a query on a background thread.
+    Matching indices are appended to matches as they are found. When query
+    extends a query that was matched before, only its matches are searched.
+    _lock guards _job, _stages and done, which both threads use.'''
+
+    def __init__(self, items) -> None:
+        self.items = items
+        self.query = ''
+        self.fuzzy = False
+        self.matches: Optional[List[int]] = None
+        self.done = True
+        self._job = 0
+        self._stages = {}  # (query, fuzzy) -> matches of finished searches
+        self._lock = threading.Lock()
+
+    def set_query(self, query: str, fuzzy: bool = False) -> None:
+        with self._lock:
+            self._job += 1
+            job = self._job
+            self.query = query
+            self.fuzzy = fuzzy
+            self._stages = {key: matches for key, matches in self._stages.items()
+                            if key[1] == fuzzy and query.lower().startswith(key[0])}
+            if not query:
+                self.matches = None
+                self.done = True
+                return
+
+            source = None
+            if self._stages:
+                source = self._stages[max(self._stages, key=lambda key: len(key[0]))]
+            self.matches = []
+            self.done = False
+        threading.Thread(target=self._run, args=(job, query, fuzzy, source, self.matches),
+                         daemon=True).start()
+
+    def _run(self, job: int, query: str, fuzzy: bool, source, matches: List[int]) -> None:
+        query = query.lower()
+        indices = source if source is not None else count()
+        for i in indices:
+            if job != self._job:
+                return
+            if source is None and not _has(self.items, i):
+                if isinstance(self.items, StreamItems):
+                    # Keep matching items as they are read.
+                    while not self.items.wait(i, 0.1) and not self.items.done:
+                        if job != self._job:
+                            return
+                if not _has(self.items, i):
+                    break
+            text = str(self.items[i]).lower()
+            if _is_subsequence(query, text) if fuzzy else query in text:
+                matches.append(i)
+        with self._lock:
+            if job == self._job:
+                self._stages[query, fuzzy] = matches
+                self.done = True
+
+
+class _View:
+    '''Items that match the current filter.'''
+
+    def __init__(self, items, matches: List[int]) -> None:
+        self.items = items
+        self.matches = matches
+
+    def has(self, index: int) -> bool:
+        return 0 <= index < len(self.matches)
+
+    def source(self, index: int) -> int:
+        '''Returns index of the row in the unfiltered items.'''
+        return self.matches[index]
+
+    def __getitem__(self, index: int):
+        return self.items[self.matches[index]]
+
+
+class _Renderer:
+    '''Draws visible rows of items, only rows that changed since last draw are
+    repainted and scrolling moves existing rows instead of redrawing them.'''
+
+    def __init__(self, stdscr, items, marked: Optional[set] = None) -> None:
+        self.stdscr = stdscr
+        self.items = items
+        self.marked = marked
+        self.start_row = None
+        self.selected_row = None
+        self.size = None
+        self.dirty = set()
+
+    def reset(self, items) -> None:
+        '''Shows other items, next draw repaints every row.'''
+        self.items = items
+        self.size = None
+
+    def _row(self, y: int, selected_row: int) -> None:
+        index = self.start_row + y
+        self.stdscr.move(y, 0)
+        self.stdscr.clrtoeol()
+        if _has(self.items, index):
+            attr = curses.color_pair(1) if index == selected_row else curses.A_NORMAL
+            text = str(self.items[index])
+            if self.marked is not None:
+                source = self.items.source(index) if isinstance(self.items, _View) else index
+                text = ('* ' if source in self.marked else '  ') + text
+            self.stdscr.addnstr(y, 0, text, self.size[1] - 1, attr)
+
+    def draw(self, start_row: int, selected_row: int, h: int) -> None:
+        size = (h, self.stdscr.getmaxyx()[1])
+        old_start, old_selected = self.start_row, self.selected_row
+        self.start_row = start_row
+
+        if size != self.size or old_start is None or abs(start_row - old_start) >= h:
+            self.size = size
+            for y in range(h):
+                self._row(y, selected_row)
+        else:
+            delta = start_row - old_start
+            dirty = set()
+            if delta:
+                self.stdscr.setscrreg(0, h - 1)
+                self.stdscr.scrollok(True)
+                self.stdscr.scroll(delta)
+                self.stdscr.scrollok(False)
+                dirty.update(range(h - delta, h) if delta > 0 else range(-delta))
+            if old_selected != selected_row:
+                dirty.update((old_selected - start_row, selected_row - start_row))
+            dirty.update(row - start_row for row in self.dirty)
+            for y in dirty:
+                if 0 <= y < h:
+                    self._row(y, selected_row)
+        self.selected_row = selected_row
+        self.dirty.clear()
+
+
+def select(stdscr, items: Iterable, multi: bool = False):
+    '''Lets user pick one of items, returns its index or None if ESC is pressed.
+    Typing filters items (Tab or Ctrl-F switches between substring and fuzzy
+    matching, ESC clears the filter), arrows, PgUp/PgDn and Home/End move the
+    selection.
+
+    ### Parameters
+    @items: any sequence, a StreamItems or a text file whose lines are read on
+        a background thread, other iterables are read only as far as they are needed.
+    @multi: Tab marks rows instead, and a sorted list of marked indices (or
+        of the current one if none is marked) is returned.
+    '''
+    if isinstance(items, io.IOBase):
+        items = StreamItems.lines(items)
+    elif not isinstance(items, (Sequence, StreamItems)):
+        items = LazyItems(items)
+
+    curses.curs_set(0)
+    curses.init_pair(1, curses.COLOR_BLACK, curses.COLOR_WHITE)
+    stdscr.idlok(True)
+    stdscr.timeout(100)  # redraw while items and filter results arrive
+    stdscr.clear()
+    stdscr.refresh()
+
+    search = _Filter(items)
+    rows = items
+    marked = set() if multi else None
+    renderer = _Renderer(stdscr, rows, marked)
+    current_row = 0
+    start_row = 0
+    shown = None  # number of rows last drawn
+
+    def set_query(query, fuzzy):
+        nonlocal rows, current_row, start_row, shown
+        search.set_query(query, fuzzy)
+        rows = items if search.matches is None else _View(items, search.matches)
+        renderer.reset(rows)
+        current_row = start_row = 0
+        shown = None
+
+    def source(row):
+        return rows.source(row) if isinstance(rows, _View) else row
+
+    streaming = isinstance(items, StreamItems)
+    while True:
+        h, w = stdscr.getmaxyx()
+        bar = search.matches is not None or streaming or multi
+        if bar:
+            h -= 1
+        # Rows added by the reader or filter thread are not drawn yet.
+        if search.matches is not None or streaming:
+            available = len(search.matches) if search.matches is not None else items.count
+            if shown is None or shown != available and shown < start_row + h:
+                renderer.reset(rows)
+            shown = available
+        renderer.draw(start_row, current_row, h)
+
+        if bar:
+            if search.matches is not None:
+                status = f' {len(search.matches)}{"" if search.done else "+"} match(es),' \
+                         f' {"fuzzy" if search.fuzzy else "substring"}'
+            else:
+                status = f' {_count(items)}{"" if getattr(items, "done", True) else "+"} item(s)'
+            if multi:
+                status += f', {len(marked)} marked'
+            stdscr.move(h, 0)
+            stdscr.clrtoeol()
+            stdscr.addnstr(h, 0, f'/{search.query}', max(w - len(status) - 1, 1))
+            stdscr.addnstr(h, max(w - len(status) - 1, 0), status, w - 1, curses.A_DIM)
+        stdscr.noutrefresh()
+        curses.doupdate()
+
+        key = stdscr.getch()
+        if key == -1:
+            continue
+
+        if key == curses.ascii.ESC:
+            if search.query:
+                set_query('', search.fuzzy)
+                continue
+            break
+
+        elif key == curses.KEY_RESIZE:
+            if current_row >= start_row + h:
+                start_row = current_row - h + 1
+
+        elif key == curses.KEY_UP and current_row > 0:
+            current_row -= 1
+            if current_row < start_row:
+                start_row -= 1  # Scroll up
+
+        elif key == curses.KEY_DOWN and _has(rows, current_row + 1):
+            current_row += 1
+            if current_row >= start_row + h:
+                start_row += 1  # Scroll down
+
+        elif key in (curses.KEY_PPAGE, curses.KEY_HOME):
+            current_row = 0 if key == curses.KEY_HOME else max(current_row - h, 0)
+            start_row = min(start_row, current_row)
+
+        elif key in (curses.KEY_NPAGE, curses.KEY_END):
+            if key == curses.KEY_END and search.matches is not None:
+                current_row = max(len(search.matches) - 1, 0)
+            elif key == curses.KEY_END:
+                # Lazy items are read a bounded step further on each press.
+                if isinstance(items, LazyItems):
+                    items.read_ahead()
+                current_row = max(_count(items) - 1, 0)
+            else:
+                target = current_row + h
+                while current_row < target and _has(rows, current_row + 1):
+                    current_row += 1
+            if current_row >= start_row + h:
+                start_row = current_row - h + 1
+
+        elif key == curses.KEY_ENTER or key in [10, 13]:
+            if multi and marked:
+                return sorted(marked)
+            if _has(rows, current_row):
+                return [source(current_row)] if multi else source(current_row)
+
+        elif key == curses.ascii.TAB and multi:
+            if _has(rows, current_row):
+                marked.symmetric_difference_update((source(current_row),))
+                renderer.dirty.add(current_row)
+                if _has(rows, current_row + 1):
+                    current_row += 1
+                    if current_row >= start_row + h:
+                        start_row += 1
+
+        elif key in (curses.ascii.TAB, curses.ascii.ctrl(ord('f'))):
+            set_query(search.query, not search.fuzzy)
+
+        elif key in (curses.KEY_BACKSPACE, curses.ascii.BS, curses.ascii.DEL):
+            set_query(search.query[:-1], search.fuzzy)
+
+        elif curses.ascii.isprint(key):
+            set_query(search.query + chr(key), search.fuzzy)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Pick lines of a file or of standard input, chosen lines are printed to standard output.')
+    parser.add_argument('file', nargs='?', help='file to read lines from, standard input by default')
+    parser.add_argument('-m', '--multi', action='store_true', help='allow choosing several lines with Tab')
+    args = parser.parse_args()
+
+    if args.file is None and sys.stdin.isatty():
+        parser.error('no file given and standard input is a terminal')
+
+    # curses draws on the terminal, not on the pipes the lines come from and go to.
+    if args.file is None:
+        source = open(os.dup(0), errors='replace')
+    else:
+        source = open(args.file, errors='replace')
+    stdout = os.dup(1)
+    tty = os.open('/dev/tty', os.O_RDWR)
+    os.dup2(tty, 0)
+    os.dup2(tty, 1)
+    os.close(tty)
+
+    items = StreamItems.lines(source, close=True)
+    try:
+        chosen = curses.wrapper(select, items, args.multi)
+    finally:
+        os.dup2(stdout, 1)
+        os.close(stdout)
+    if chosen is None:
+        sys.exit(1)
+    for index in chosen if args.multi else [chosen]:
+        print(items[index])
+
+
+if __name__ == "__main__":
+    files = ['appcompat', 'apppatch', 'AppReadiness', 'assembly', 'bcastdvr', 'bfsvc.exe', 'BitLockerDiscoveryVolumeContents', 'Boot', 'bootstat.dat', 'Branding', 'BrowserCore', 'CbsTemp', 'Containers', 'CSC', 'Cursors', 'debug', 'diagnostics', 'DiagTrack', 'DigitalLocker', 'Downloaded Program Files', 'DtcInstall.log', 'ELAMBKUP', 'en-US', 'explorer.exe', 'Fonts', 'GameBarPresenceWriter', 'Globalization', 'Help', 'HelpPaneX.exe', 'hh.exe', 'IdentityCRL', 'IME', 'ImmersiveControlPanel', 'InboxApps', 'INF', 'InputMethod', 'Installer', 'L2Schemas', 'LanguageOverlayCache', 'LiveKernelReports', 'Logs', 'lsasetup.log', 'Media', 'mib.bin', 'Microsoft.NET', 'Migration', 'ModemLogs', 'notepad.exe', 'NvContainerRecovery.bat', 'OCR', 'Offline Web Pages', 'Panther', 'Performance', 'PFRO.log', 'PLA', 'PolicyDefinitions', 'Prefetch', 'PrintDialog', 'Professional.xml', 'Provisioning', 'py.exe', 'pyshellext.amd64.dll', 'pyw.exe', 'regedit.exe', 'Registration', 'RemotePackages', 'rescache', 'Resources', 'SchCache', 'schemas', 'security', 'ServiceProfiles', 'ServiceState', 'servicing', 'Setup', 'setupact.log', 'setuperr.log', 'ShellComponents', 'ShellExperiences', 'SKB', 'SoftwareDistribution', 'Speech', 'Speech_OneCore', 'splwow64.exe', 'System', 'system.ini', 'System32', 'SystemApps', 'SystemResources', 'SystemTemp', 'SysWOW64', 'TAPI', 'Tasks', 'Temp', 'tracing', 'twain_32', 'twain_32.dll', 'UUS', 'Vss', 'WaaS', 'Web', 'win.ini', 'WindowsShell.Manifest', 'WindowsUpdate.log', 'winhlp32.exe', 'WinSxS', 'WMSysPr9.prx', 'write.exe', 'WUModels']
+    if len(sys.argv) > 1 or not sys.stdin.isatty():
+        main()
+    else:
+        curses.wrapper(select, files)
+
@@ -1,9 +1,23 @@
-from filecmp import cmp
+import argparse
+from collections import defaultdict, deque
+import csv
+import errno
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from fnmatch import fnmatch
+from itertools import chain
+import hashlib
+import json
 import os
-from os.path import join
-from typing import List
+import shutil
+import sqlite3
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 from sys import platform
-from time import time_ns
+from time import time, time_ns
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 def clear_screen():
@@ -13,34 +27,329 @@ def clear_screen():
         os.system('clear')
 
 
-def print_diplicates(paths: List[str]):
-    files = []
-    for root in paths:
-        for path, _, names in os.walk(root):
-            for name in names:
-                file = join(path, name)
-                files.append(file)
+PARTIAL_SIZE = 4096
+CHUNK_SIZE = 1024 * 1024
+
+
+def partial_hash(file: str, size: int) -> str:
+    '''Hashes first and last PARTIAL_SIZE bytes of file.
+    Files smaller than 2*PARTIAL_SIZE are hashed completely.'''
+    h = hashlib.blake2b(digest_size=16)
+    with open(file, 'rb') as f:
+        if size <= 2 * PARTIAL_SIZE:
+            h.update(f.read())
+        else:
+            h.update(f.read(PARTIAL_SIZE))
+            f.seek(-PARTIAL_SIZE, os.SEEK_END)
+            h.update(f.read(PARTIAL_SIZE))
+    return h.hexdigest()
+
+
+def full_hash(file: str) -> str:
+    '''Hashes whole file content in chunks of CHUNK_SIZE.'''
+    h = hashlib.blake2b()
+    with open(file, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_map(func, files: Iterable[str], workers: int = 1) -> Iterator[Tuple[str, Optional[str]]]:
+    '''Yields (file, func(file)) computed on a pool of worker threads.
+    At most 2*workers files are pending at a time so memory does not grow with
+    the number of files. Digest is None for files that could not be read.'''
+    def task(file):
+        try:
+            return file, func(file)
+        except OSError:
+            return file, None
+
+    def results(futures):
+        for future in futures:
+            yield future.result()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for file in files:
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from results(done)
+            pending.add(executor.submit(task, file))
+        yield from results(pending)
+
+
+FileKey = Tuple[int, int, int, int]
+
+
+def file_key(st: os.stat_result) -> FileKey:
+    '''Returns (device, inode, size, mtime) that identify a version of a file.'''
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class HashCache:
+    '''Persistent store of partial and full digests backed by SQLite.
+    Entries are keyed on path and only used while device, inode, size and
+    mtime of the file are unchanged. Entries that were not used for @max_age
+    seconds are evicted on close.'''
+
+    KINDS = ('partial', 'full')
+
+    def __init__(self, path: str, max_age: float = 30 * 24 * 3600) -> None:
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS hashes (
+            path TEXT PRIMARY KEY, dev INTEGER, ino INTEGER, size INTEGER,
+            mtime_ns INTEGER, partial TEXT, full TEXT, seen REAL)''')
+        self.max_age = max_age
+        self.now = time()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file: str, key: FileKey, kind: str) -> Optional[str]:
+        '''Returns cached digest of given kind or None if file has changed.
+        @key: file_key of the file.'''
+        assert kind in self.KINDS
+        row = self.conn.execute(
+            f'SELECT dev, ino, size, mtime_ns, {kind} FROM hashes WHERE path = ?',
+            (file,)).fetchone()
+        if row and row[:4] == key and row[4]:
+            self.conn.execute(
+                'UPDATE hashes SET seen = ? WHERE path = ?', (self.now, file))
+            self.hits += 1
+            return row[4]
+        self.misses += 1
+        return None
+
+    def put(self, file: str, key: FileKey, kind: str, digest: str) -> None:
+        assert kind in self.KINDS
+        row = self.conn.execute(
+            'SELECT dev, ino, size, mtime_ns FROM hashes WHERE path = ?',
+            (file,)).fetchone()
+        if row == key:
+            self.conn.execute(
+                f'UPDATE hashes SET {kind} = ?, seen = ? WHERE path = ?',
+                (digest, self.now, file))
+        else:
+            self.conn.execute(
+                f'INSERT OR REPLACE INTO hashes (path, dev, ino, size, mtime_ns, {kind}, seen) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', (file, *key, digest, self.now))
+
+    def close(self) -> None:
+        '''Evicts stale entries and saves the cache.'''
+        self.conn.execute('DELETE FROM hashes WHERE seen < ?',
+                          (self.now - self.max_age,))
+        self.conn.commit()
+        self.conn.close()
+
+
+def walk_files(roots: Iterable[str], min_size: int = 0, max_size: Optional[int] = None,
+               include: Sequence[str] = (), exclude: Sequence[str] = (),
+               one_file_system: bool = False) -> Iterator[Tuple[str, os.stat_result]]:
+    '''Yields (path, stat) of regular files under roots as they are found.
+    Symlinks are never followed, directories are visited once and hardlinks
+    to an already yielded inode are skipped. Backups made by Deduper are
+    skipped too, so a resumed run does not treat them as duplicates.
+
+    ### Parameters
+    @min_size, @max_size: size limits in bytes, files outside them are skipped.
+    @include: glob patterns, if given only matching file names are yielded.
+    @exclude: glob patterns, matching files and directories are skipped.
+    @one_file_system: do not descend into directories on other devices.'''
+    def excluded(entry):
+        return any(fnmatch(entry.name, p) or fnmatch(entry.path, p) for p in exclude)
+
+    visited = set()
+    links = set()
+    for root in roots:
+        root_dev = os.stat(root).st_dev
+        stack = [root]
+        while stack:
+            path = stack.pop()
+            try:
+                st = os.stat(path)
+                if (st.st_dev, st.st_ino) in visited:
+                    continue
+                visited.add((st.st_dev, st.st_ino))
+                it = os.scandir(path)
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    if entry.is_symlink() or entry.name.endswith(BACKUP_SUFFIX) or excluded(entry):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if one_file_system and entry.stat(follow_symlinks=False).st_dev != root_dev:
+                                continue
+                            stack.append(entry.path)
+                            continue
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if st.st_size < min_size or (max_size is not None and st.st_size > max_size):
+                        continue
+                    if include and not any(fnmatch(entry.name, p) for p in include):
+                        continue
+                    if st.st_nlink > 1:
+                        if (st.st_dev, st.st_ino) in links:
+                            continue
+                        links.add((st.st_dev, st.st_ino))
+                    yield entry.path, st
 
-    size = len(files)
-    similar_groups = []
-    print(f'found: {size} file(s)')
 
-    for i in range(size):
-        print(f'\rProgress: {round(100*(i+1)/size, 1)}%', end='')
-        if any([files[i] in groups for groups in similar_groups]):
+def iter_duplicates(entries: Iterable[Tuple[str, os.stat_result]], workers: int = 1,
+                    progress=None, cache: Optional[HashCache] = None
+                    ) -> Iterator[Tuple[int, str, List[str]]]:
+    '''Yields (size, digest, files) for each group of identical files among
+    (path, stat) entries as soon as the group is confirmed.
+    Files are grouped by size, then by partial hash and only files that still
+    collide are hashed completely. Files that fit in the partial hash are
+    hashed completely right away, so every group reports its full digest.
+    Groups are yielded in order of size and digest whatever order the hashes
+    finish in. Hashing is done on @workers threads and @progress is called
+    with number of bytes read after each hashed file. Digests found in @cache
+    are reused and new ones are stored in it.'''
+    # Only file_key of each file is kept and files with a unique size are
+    # dropped before hashing.
+    by_size: Dict[int, List[Tuple[str, FileKey]]] = defaultdict(list)
+    for file, st in entries:
+        by_size[st.st_size].append((file, file_key(st)))
+    keys: Dict[str, FileKey] = {}
+    for size in list(by_size):
+        files = by_size.pop(size)
+        if len(files) > 1:
+            keys.update(files)
+    del by_size
+
+    def hashed(func, kind, files, nbytes):
+        misses = []
+        for file in files:
+            digest = cache.get(file, keys[file], kind) if cache else None
+            if digest is None:
+                misses.append(file)
+            else:
+                yield file, digest
+        for file, digest in hash_map(func, misses, workers):
+            if digest is not None:
+                if cache:
+                    cache.put(file, keys[file], kind, digest)
+                if progress:
+                    progress(nbytes(keys[file][2]))
+            yield file, digest
+
+    small = sorted(file for file, key in keys.items() if key[2] <= 2 * PARTIAL_SIZE)
+    large = sorted(file for file, key in keys.items() if key[2] > 2 * PARTIAL_SIZE)
+    partials: Dict[Tuple[int, str], List[str]] = defaultdict(list)
+    for file, digest in chain(
+            hashed(full_hash, 'full', small, lambda size: size),
+            hashed(lambda file: partial_hash(file, keys[file][2]), 'partial', large,
+                   lambda size: 2 * PARTIAL_SIZE)):
+        if digest is not None:
+            partials[keys[file][2], digest].append(file)
+
+    # Groups of large files are split by full hash once all of their files
+    # are hashed, groups that finish early are held back until the groups
+    # before them are yielded.
+    order = deque(sorted(key for key, files in partials.items() if len(files) > 1))
+    ready: Dict[Tuple[int, str], Dict[str, List[str]]] = {}
+    parent = {}
+    remaining = {}
+    fulls: Dict[Tuple[int, str], Dict[str, List[str]]] = defaultdict(lambda: defaultdict(list))
+    for key in order:
+        files = partials[key]
+        if key[0] <= 2 * PARTIAL_SIZE:
+            ready[key] = {key[1]: files}
             continue
-        similars = []
-        for j in range(i+1, size):
-            is_similar = cmp(files[i], files[j], shallow=False)
-            if is_similar:
-                similars.append(files[j])
-        if similars:
-            similars.insert(0, files[i])
-            similar_groups.append(similars)
+        remaining[key] = len(files)
+        for file in files:
+            parent[file] = key
+    del partials
+
+    def flush():
+        while order and order[0] in ready:
+            key = order.popleft()
+            for digest, files in sorted(ready.pop(key).items()):
+                if len(files) > 1:
+                    yield key[0], digest, sorted(files)
+
+    yield from flush()
+    for file, digest in hashed(full_hash, 'full', list(parent), lambda size: size):
+        key = parent.pop(file)
+        if digest is not None:
+            fulls[key][digest].append(file)
+        remaining[key] -= 1
+        if remaining[key] == 0:
+            del remaining[key]
+            ready[key] = fulls.pop(key, {})
+            yield from flush()
+
+
+def find_duplicates(entries: Iterable[Tuple[str, os.stat_result]], workers: int = 1,
+                    progress=None, cache: Optional[HashCache] = None) -> List[List[str]]:
+    '''Returns sorted groups of identical files, see iter_duplicates.'''
+    return sorted(files for _, _, files in iter_duplicates(entries, workers, progress, cache))
+
+
+def format_size(size: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} TB'
+
+
+def scan(paths: List[str], quiet: bool = False, **filters) -> Iterator[Tuple[str, os.stat_result]]:
+    '''walk_files that prints number of files found.'''
+    count = 0
+    for entry in walk_files(paths, **filters):
+        count += 1
+        if not quiet and count % 1000 == 0:
+            print(f'\rScanning: {count} file(s)', end='')
+        yield entry
+    if not quiet:
+        print(f'\rfound: {count} file(s)')
+
+
+def progress_printer():
+    '''Returns a progress callback for iter_duplicates that prints files and
+    bytes hashed per second.'''
+    start = time()
+    count = 0
+    total_bytes = 0
+
+    def progress(nbytes):
+        nonlocal count, total_bytes
+        count += 1
+        total_bytes += nbytes
+        elapsed = max(time() - start, 1e-6)
+        print(f'\rProgress: {count} file(s) hashed, '
+              f'{count / elapsed:.1f} file(s)/s, '
+              f'{format_size(total_bytes / elapsed)}/s', end='')
+    return progress
+
+
+def print_summary(groups: int, dups: int, cache: Optional[HashCache] = None, reclaimable: int = None):
+    summary = f'found {groups} group(s) & {dups} duplicate(s)'
+    if reclaimable is not None:
+        summary += f', {format_size(reclaimable)} reclaimable'
+    if cache:
+        summary += f', cache: {cache.hits} hit(s) & {cache.misses} miss(es)'
+    print(f'\n{summary}.\n')
+
+
+def print_diplicates(paths: List[str], workers: int = 1, cache: Optional[HashCache] = None,
+                     **filters):
+    '''@filters are passed to walk_files.'''
+    similar_groups = find_duplicates(
+        scan(paths, **filters), workers, progress_printer(), cache)
 
     dups = sum([len(groups) for groups in similar_groups]) \
         - len(similar_groups)
-    print(f'\nfound {len(similar_groups)} group(s) & {dups} duplicate(s).\n')
+    print_summary(len(similar_groups), dups, cache)
 
     if len(similar_groups) > 15:
         return similar_groups
@@ -53,6 +362,56 @@ def print_diplicates(paths: List[str]):
     return similar_groups
 
 
+class Report:
+    '''Writes groups of duplicates to a NDJSON or CSV file as they are found.
+    Format is taken from @fmt, or from extension of @path if not given.'''
+
+    CSV_FIELDS = ('group', 'size', 'digest', 'reclaimable', 'file')
+
+    def __init__(self, path: str, fmt: Optional[str] = None) -> None:
+        self.fmt = fmt or ('csv' if path.endswith('.csv') else 'jsonl')
+        self.file = open(path, 'w', newline='')
+        self.groups = 0
+        self.dups = 0
+        self.reclaimable = 0
+        if self.fmt == 'csv':
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.CSV_FIELDS)
+
+    def write(self, size: int, digest: str, files: List[str]) -> None:
+        self.groups += 1
+        self.dups += len(files) - 1
+        reclaimable = size * (len(files) - 1)
+        self.reclaimable += reclaimable
+        if self.fmt == 'csv':
+            for file in files:
+                self.writer.writerow((self.groups, size, digest, reclaimable, file))
+        else:
+            record = {'group': self.groups, 'size': size, 'digest': digest,
+                      'reclaimable': reclaimable, 'files': files}
+            self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def report_duplicates(paths: List[str], report: Report, workers: int = 1,
+                      cache: Optional[HashCache] = None, quiet: bool = False,
+                      deduper: Optional['Deduper'] = None, **filters):
+    '''Writes every group of duplicates to @report without keeping them in memory.
+    If @deduper is given it is applied to each group as it is found.
+    @filters are passed to walk_files.'''
+    progress = None if quiet else progress_printer()
+    for size, digest, files in iter_duplicates(
+            scan(paths, quiet, **filters), workers, progress, cache):
+        report.write(size, digest, files)
+        if deduper:
+            deduper.apply(files)
+    if not quiet:
+        print_summary(report.groups, report.dups, cache, report.reclaimable)
+
+
 def validate_path(path: str):
     if not os.path.exists(path):
         print('Given path does not exists.')
@@ -134,14 +493,172 @@ def input_paths() -> List[str]:
     return paths
 
 
-def safe_delete(similar_groups: List[List[str]]):
+ACTIONS = ('delete', 'hardlink', 'reflink')
+BACKUP_SUFFIX = '.dedupe~'
+JOURNAL = 'dedupe.journal'
+FICLONE = 0x40049409
+
+
+def reflink(src: str, dst: str) -> None:
+    '''Creates dst sharing data blocks with src, only works on file systems
+    supporting FICLONE (btrfs, xfs...).'''
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'reflink is not supported on this platform')
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def read_journal(path: str) -> Dict[str, str]:
+    '''Returns last recorded state of each file in journal.'''
+    states = {}
+    if not os.path.exists(path):
+        return states
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # last line of an interrupted run may be incomplete
+            states[record['file']] = record['state']
+    return states
+
+
+class Deduper:
+    '''Replaces duplicates with @action keeping the first file of each group.
+    Each file is renamed to a backup before it is replaced and every step is
+    written to @journal, so an interrupted run can be resumed by running it
+    again with the same journal or undone with rollback(). Backups are removed
+    and journal is deleted on commit().
+
+    ### Parameters
+    @action: one of ACTIONS.
+    @dry_run: only count files and bytes that would be reclaimed.
+    @quiet: do not print progress.'''
+
+    def __init__(self, action: str = 'delete', dry_run: bool = False,
+                 journal: str = JOURNAL, quiet: bool = False) -> None:
+        if action not in ACTIONS:
+            raise ValueError(f'Unknown action: {action}')
+        self.action = action
+        self.dry_run = dry_run
+        self.quiet = quiet
+        self.journal = journal
+        self.states = {} if dry_run else read_journal(journal)
+        # Files an interrupted run was replacing are restored before scanning,
+        # their backups are never scanned.
+        for file, state in self.states.items():
+            backup = file + BACKUP_SUFFIX
+            if state == 'pending' and os.path.exists(backup) and not os.path.exists(file):
+                os.replace(backup, file)
+        self.log = None if dry_run else open(journal, 'a')
+        self.count = 0
+        self.failed = 0
+        self.reclaimed = 0
+
+    def _write(self, state: str, file: str, keep: str) -> None:
+        self.log.write(json.dumps({'state': state, 'action': self.action,
+                                   'file': file, 'keep': keep}) + '\n')
+        self.log.flush()
+
+    def _replace(self, keep: str, file: str) -> None:
+        if self.action == 'hardlink':
+            os.link(keep, file)
+        elif self.action == 'reflink':
+            reflink(keep, file)
+            shutil.copystat(file + BACKUP_SUFFIX, file)
+
+    def _owned(self, file: str) -> bool:
+        '''Checks if file is a backup or the journal of a Deduper.'''
+        if file.endswith(BACKUP_SUFFIX):
+            return True
+        try:
+            return os.path.samefile(file, self.journal)
+        except OSError:
+            return False
+
+    def apply(self, files: List[str]) -> None:
+        '''Replaces all but the first of files, backups and the journal are never touched.'''
+        files = [file for file in files if not self._owned(file)]
+        if len(files) < 2:
+            return
+        keep = files[0]
+        for file in files[1:]:
+            if self.states.get(file) == 'done':
+                continue
+            backup = file + BACKUP_SUFFIX
+            if os.path.exists(backup):
+                if self.states.get(file) != 'pending':
+                    # Backup of a run whose journal is lost, leave both alone.
+                    if not self.quiet:
+                        print(f'\nSkipping {file}: {backup} already exists')
+                    self.failed += 1
+                    continue
+                os.replace(backup, file)
+            try:
+                size = os.stat(file).st_size
+                if self.action != 'delete' and os.path.samefile(keep, file):
+                    continue
+            except OSError:
+                continue
+
+            if not self.dry_run:
+                self._write('pending', file, keep)
+                try:
+                    os.replace(file, backup)
+                    try:
+                        self._replace(keep, file)
+                    except OSError:
+                        os.replace(backup, file)
+                        raise
+                except OSError:
+                    self._write('failed', file, keep)
+                    self.failed += 1
+                    continue
+                self._write('done', file, keep)
+
+            self.count += 1
+            self.reclaimed += size
+            if not self.quiet and self.count % 100 == 0:
+                self._progress(end='')
+
+    def _progress(self, end: str = '\n') -> None:
+        verb = f'Would {self.action}' if self.dry_run else self.action.capitalize().rstrip('e') + 'ed'
+        line = f'\r{verb}: {self.count} file(s), {format_size(self.reclaimed)} reclaimed'
+        if self.failed:
+            line += f', {self.failed} failed'
+        print(line, end=end)
+
+    def commit(self) -> None:
+        '''Removes backups of replaced files and the journal.'''
+        if not self.dry_run:
+            self.log.close()
+            for file, state in read_journal(self.journal).items():
+                if state == 'done' and os.path.exists(file + BACKUP_SUFFIX):
+                    os.remove(file + BACKUP_SUFFIX)
+            os.remove(self.journal)
+        if not self.quiet:
+            self._progress()
+
+
+def rollback(journal: str = JOURNAL) -> int:
+    '''Restores files replaced by an interrupted run from their backups.
+    Returns number of restored files.'''
     count = 0
-    for groups in similar_groups:
-        for file in groups[1:]:
-            os.remove(file)
-            print(f'Removed: {file}')
+    for file, state in read_journal(journal).items():
+        backup = file + BACKUP_SUFFIX
+        if state in ('pending', 'done') and os.path.exists(backup):
+            os.replace(backup, file)
             count += 1
-    print(f'Removed: {count} file(s)')
+    os.remove(journal)
+    return count
+
+
+def safe_delete(similar_groups: List[List[str]], action: str = 'delete',
+                dry_run: bool = False, journal: str = JOURNAL):
+    deduper = Deduper(action, dry_run, journal)
+    for group in similar_groups:
+        deduper.apply(group)
+    deduper.commit()
 
 
 def create_log(similar_groups: List[List[str]]):
@@ -153,13 +670,86 @@ def create_log(similar_groups: List[List[str]]):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find duplicate files.')
+    parser.add_argument('roots', type=str, nargs='*',
+                        help='Directories to search, paths are asked interactively if not given')
+    parser.add_argument('--report', type=str, default=None,
+                        help='Write groups to this NDJSON or CSV file as they are found')
+    parser.add_argument('--format', choices=('jsonl', 'csv'), default=None,
+                        help='Report format, guessed from the report extension by default')
+    parser.add_argument('--quiet', action='store_true',
+                        help='Do not print progress or summary')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of threads used for hashing files')
+    parser.add_argument('--cache', type=str, default=os.path.expanduser('~/.duplicate_finder.db'),
+                        help='Path to the hash cache database')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not read or write the hash cache')
+    parser.add_argument('--min-size', type=int, default=0,
+                        help='Skip files smaller than this many bytes')
+    parser.add_argument('--max-size', type=int, default=None,
+                        help='Skip files larger than this many bytes')
+    parser.add_argument('--include', action='append', default=[],
+                        help='Only check files matching this glob, can be repeated')
+    parser.add_argument('--exclude', action='append', default=[],
+                        help='Skip files and directories matching this glob, can be repeated')
+    parser.add_argument('--one-file-system', action='store_true',
+                        help='Do not cross file system boundaries')
+    parser.add_argument('--action', choices=ACTIONS, default=None,
+                        help='Replace duplicates, with roots given it is applied without asking')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only report how many bytes the action would reclaim')
+    parser.add_argument('--journal', type=str, default=JOURNAL,
+                        help='Journal used to resume or roll back an interrupted action')
+    parser.add_argument('--rollback', action='store_true',
+                        help='Restore files replaced by an interrupted action and exit')
+    args = parser.parse_args()
+
+    if args.rollback:
+        if not os.path.exists(args.journal):
+            print(f'Error: The journal "{args.journal}" was not found.')
+            exit(1)
+        print(f'Restored: {rollback(args.journal)} file(s)')
+        exit(0)
+    filters = dict(min_size=args.min_size, max_size=args.max_size, include=args.include,
+                   exclude=args.exclude, one_file_system=args.one_file_system)
+
+    if args.roots:
+        for root in args.roots:
+            if not os.path.isdir(root):
+                print(f'Error: "{root}" is not a directory.')
+                exit(1)
+        if not args.report:
+            print('Error: --report is required when roots are given.')
+            exit(1)
+        cache = None if args.no_cache else HashCache(args.cache)
+        report = Report(args.report, args.format)
+        deduper = Deduper(args.action, args.dry_run, args.journal, args.quiet) \
+            if args.action else None
+        try:
+            report_duplicates(args.roots, report, args.workers, cache, args.quiet,
+                              deduper, **filters)
+        finally:
+            report.close()
+            if cache:
+                cache.close()
+        if deduper:
+            deduper.commit()
+        exit(0)
+
     paths = input_paths()
-    groups = print_diplicates(paths)
+    cache = None if args.no_cache else HashCache(args.cache)
+    try:
+        groups = print_diplicates(paths, args.workers, cache, **filters)
+    finally:
+        if cache:
+            cache.close()
     if len(groups) == 0:
         exit(0)
     choice = input('Create log? (y/n): ')
     if choice in ('y', 'Y'):
         create_log(groups)
-    choice = input('Safely remove duplicates: (y/n): ')
+    action = args.action or 'delete'
+    choice = input(f'Safely {action} duplicates: (y/n): ')
     if choice in ('y', 'Y'):
-        safe_delete(groups)
+        safe_delete(groups, action, args.dry_run, args.journal)
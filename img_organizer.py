@@ -1,6 +1,25 @@
-from typing import List
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
 from sklearn import neighbors
+from functools import partial
+from multiprocessing import Pool
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import io
+import json
+import math
+import numpy as np
 import os
+import queue
+import re
+import select
+import struct
+import threading
+import time
+import zipfile
 import pickle
 import face_recognition
 from face_recognition.face_recognition_cli import image_files_in_folder
@@ -11,101 +30,705 @@ import shutil
 '''An image organizer app that uses KNN model for classifying and organizing images.'''
 
 
-def train(train_dir: str = 'dataset', save_path: str = 'trained_model.pik'):
-    '''Trains a knn classifier for face recognition.
-    @train_dir: path to dir containing images of a person, dir name will be used as person's name'''
+MODEL_PATH = 'trained_model.npz'
+# Default path of pickled KNN models, older versions trained only those.
+KNN_MODEL_PATH = 'trained_model.pik'
+
+
+def locate_faces(image, max_size: int = 800) -> List[Tuple[int, int, int, int]]:
+    '''Finds face locations on a downsampled copy of image and scales them back.
+    @max_size: longest side of the copy used for detection.'''
+    height, width = image.shape[:2]
+    step = max(1, math.ceil(max(height, width) / max_size))
+    boxes = face_recognition.face_locations(np.ascontiguousarray(image[::step, ::step]))
+    return [(top * step, min(right * step, width), min(bottom * step, height), left * step)
+            for top, right, bottom, left in boxes]
+
+
+class FaceCache:
+    '''Detected face boxes and encodings keyed by hash of the image bytes, so
+    copies of an image and images seen before are not decoded again.
+    Each image is stored as {path}/{hash}.npz, entries are touched when used
+    and least recently used ones are removed once the cache grows beyond
+    @max_bytes. Workers only read and add entries, evict() runs in the parent.'''
+
+    def __init__(self, path: str = '.face_cache', max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[list, list]]:
+        '''Returns (boxes, encodings) or None if image is not cached.'''
+        file = join(self.path, key + '.npz')
+        try:
+            with np.load(file, allow_pickle=False) as data:
+                boxes = [tuple(box) for box in data['boxes'].tolist()]
+                encodings = list(data['encodings'])
+            os.utime(file)
+        except (OSError, ValueError, KeyError):
+            return None
+        return boxes, encodings
+
+    def put(self, key: str, boxes: list, encodings: list) -> None:
+        file = join(self.path, key + '.npz')
+        tmp = f'{file}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, boxes=np.array(boxes, dtype=np.int64).reshape(-1, 4),
+                     encodings=np.array(encodings).reshape(-1, 128))
+        os.replace(tmp, file)
+
+    def evict(self) -> None:
+        '''Removes least recently used entries until cache fits in max_bytes.'''
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.npz'):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+def encode_faces(img_path: str, cache: Optional[FaceCache] = None) -> list:
+    '''Returns encodings of all faces found in image, runs in worker processes.
+    Images found in @cache are not decoded.'''
+    with open(img_path, 'rb') as f:
+        data = f.read()
+    key = cache.key(data) if cache else None
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached[1]
+
+    image = face_recognition.load_image_file(io.BytesIO(data))
+    face_locations = locate_faces(image)
+    encodings = []
+    if face_locations:
+        encodings = face_recognition.face_encodings(image, known_face_locations=face_locations)
+    if cache:
+        cache.put(key, face_locations, encodings)
+    return encodings
+
+
+def try_encode_faces(img_path: str, cache: Optional[FaceCache] = None) -> Tuple[Optional[list], Optional[str]]:
+    '''Returns (encodings, None) or (None, error) if the image could not be
+    read or decoded, so one bad image does not stop a whole batch.'''
+    try:
+        return encode_faces(img_path, cache), None
+    except Exception as e:  # missing files, but also any decoder error of PIL
+        return None, f'{type(e).__name__}: {e}'
+
+
+def encode_images(img_paths: List[str], jobs: Optional[int] = None,
+                  cache: Optional[FaceCache] = None) -> Iterator[Tuple[str, list]]:
+    '''Yields (img_path, encodings) decoding and encoding images on a pool of
+    @jobs processes, images are sent to workers in batches.'''
+    jobs = jobs or os.cpu_count() or 1
+    chunksize = max(1, min(16, len(img_paths) // (jobs * 4)))
+    start = time.time()
+    with Pool(jobs) as pool:
+        results = pool.imap(partial(encode_faces, cache=cache), img_paths, chunksize=chunksize)
+        for i, (img_path, encodings) in enumerate(zip(img_paths, results)):
+            rate = (i + 1) / max(time.time() - start, 1e-6)
+            print(f'Processing: {i+1}/{len(img_paths)} ({rate:.1f} images/s) \r', end='')
+            yield img_path, encodings
+    print()
+    if cache:
+        cache.evict()
+
+
+class EmbeddingStore:
+    '''Persistent face encodings of training images.
+    Encodings are kept in {path}.npy and {path}.json maps each image path to
+    [size, mtime_ns, row] where row is its row in the array, or None if no face
+    was found in it. An image is encoded again only if its size or mtime changes.'''
+
+    VERSION = 1
+
+    def __init__(self, path: str = 'embeddings') -> None:
+        self.npy_path = path + '.npy'
+        self.index_path = path + '.json'
+        self.files = {}
+        self.vectors = np.empty((0, 128))
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index.get('version') == self.VERSION:
+                self.files = index['files']
+                self.vectors = np.load(self.npy_path, mmap_mode='r')
+        except (OSError, ValueError):
+            self.files = {}
+
+    def update(self, img_paths: List[str], jobs: Optional[int] = None,
+               cache: Optional[FaceCache] = None) -> Dict[str, Optional[np.ndarray]]:
+        '''Returns encoding of first face in each image (None if it has no face).
+        Only new or changed images are encoded, images that are not in
+        @img_paths are dropped from the store.'''
+        # Images whose person directory was renamed are found by name, size and mtime.
+        moved = {(os.path.basename(path), size, mtime): (path, row)
+                 for path, (size, mtime, row) in self.files.items()}
+
+        encodings = {}
+        pending = []
+        for img_path in img_paths:
+            st = os.stat(img_path)
+            entry = self.files.get(img_path)
+            if entry is None or entry[:2] != [st.st_size, st.st_mtime_ns]:
+                entry = moved.get((os.path.basename(img_path), st.st_size, st.st_mtime_ns))
+                entry = [st.st_size, st.st_mtime_ns, entry[1]] if entry else None
+            if entry is None:
+                pending.append(img_path)
+                continue
+            row = entry[2]
+            encodings[img_path] = None if row is None else np.array(self.vectors[row])
+
+        if pending:
+            for img_path, faces in encode_images(pending, jobs, cache):
+                encodings[img_path] = faces[0] if faces else None
+
+        self._save(encodings)
+        return encodings
+
+    def _save(self, encodings: Dict[str, Optional[np.ndarray]]) -> None:
+        files = {}
+        vectors = []
+        for img_path, encoding in encodings.items():
+            st = os.stat(img_path)
+            row = None
+            if encoding is not None:
+                row = len(vectors)
+                vectors.append(encoding)
+            files[img_path] = [st.st_size, st.st_mtime_ns, row]
+
+        array = np.array(vectors).reshape(-1, 128)
+        with open(self.npy_path + '.tmp', 'wb') as f:
+            np.save(f, array)
+        with open(self.index_path + '.tmp', 'w') as f:
+            json.dump({'version': self.VERSION, 'files': files}, f)
+        os.replace(self.npy_path + '.tmp', self.npy_path)
+        os.replace(self.index_path + '.tmp', self.index_path)
+        self.files = files
+        self.vectors = array
+
+
+def train(train_dir: str = 'dataset', save_path: Optional[str] = None, jobs: Optional[int] = None,
+          store_path: str = 'embeddings', matcher: str = 'numpy', face_cache: Optional[FaceCache] = None):
+    '''Trains a face recognition model.
+    @train_dir: path to dir containing images of a person, dir name will be used as person's name
+    @save_path: defaults to KNN_MODEL_PATH for knn and MODEL_PATH for other matchers.
+    @jobs: number of processes used for encoding images, defaults to number of cpus.
+    @store_path: encodings are cached in this EmbeddingStore, so only new or changed images are encoded.
+    @matcher: one of MATCHERS, knn models are pickled and others are saved as npz.
+    @face_cache: FaceCache shared with organize.'''
     x = []
     y = []
 
     # Loop through each person in the training set
     dirs = [join(train_dir, path)
             for path in os.listdir(train_dir) if os.path.isdir(join(train_dir, path))]
-    dirs_len = len(dirs)
     if not dirs:
         print('No dataset found.')
         return
 
+    labels = {}
+    for class_dir in dirs:
+        for img_path in image_files_in_folder(class_dir):
+            labels[img_path] = os.path.basename(class_dir)
+
     utils.clear_screen()
     print('Training model...')
-    for i, class_dir in enumerate(dirs):
-        # Loop through each training image for the current person
-        for img_path in image_files_in_folder(class_dir):
-            print(f'Processing: {i+1}/{dirs_len} \r', end='')
-            image = face_recognition.load_image_file(img_path)
-            face_bounding_boxes = face_recognition.face_locations(image)
-
-            if len(face_bounding_boxes) >= 1:
-                encoding = face_recognition.face_encodings(
-                    image, known_face_locations=face_bounding_boxes)[0]
-                x.append(encoding)
-                y.append(os.path.basename(class_dir))
+    encodings = EmbeddingStore(store_path).update(list(labels), jobs, face_cache)
+    for img_path, encoding in encodings.items():
+        if encoding is not None:
+            x.append(encoding)
+            y.append(labels[img_path])
     print('Training complete...')
     utils.pause()
+    if not x:
+        print('No faces found in dataset.')
+        return
+
+    if save_path is None:
+        save_path = KNN_MODEL_PATH if matcher == KnnMatcher.kind else MODEL_PATH
+    matcher = MATCHERS[matcher]().fit(x, y)
+    matcher.save(save_path)
+    return matcher
+
+
+def vote(distances, labels, names, threshold: float = 0.6) -> List[str]:
+    '''Picks a name for each face from the distances and labels of its nearest
+    known faces (closest first), weighted by inverse distance like sklearn's
+    KNeighborsClassifier with weights='distance'. Faces farther than threshold
+    from their closest match are "unknown".'''
+    result = []
+    for dist, label in zip(distances, labels):
+        if dist[0] > threshold:
+            result.append('unknown')
+            continue
+        # Exact matches take all the weight.
+        weights = (dist == 0).astype(float) if (dist == 0).any() else 1 / dist
+        votes = np.bincount(label, weights=weights, minlength=len(names))
+        result.append(str(names[np.argmax(votes)]))
+    return result
+
+
+class Matcher(ABC):
+    '''Labels face encodings with names of the closest known faces.'''
+
+    kind = None
+
+    def __init__(self, threshold: float = 0.6) -> None:
+        self.threshold = threshold
+
+    @abstractmethod
+    def fit(self, x, y) -> 'Matcher':
+        ...
+
+    @abstractmethod
+    def match(self, faces_encodings) -> List[str]:
+        '''Labels many faces at once, see vote().'''
+
+    @abstractmethod
+    def save(self, path: str) -> None:
+        ...
+
+
+class KnnMatcher(Matcher):
+    '''sklearn ball_tree KNN classifier, saved with pickle together with the
+    label of each training face.
+    Classifiers pickled on their own by older versions have no labels, their
+    faces are labeled with predict() instead.'''
+
+    kind = 'knn'
+
+    def __init__(self, knn_clf=None, threshold: float = 0.6, labels=None) -> None:
+        super().__init__(threshold)
+        self.knn_clf = knn_clf
+        self.labels = labels
+
+    def fit(self, x, y) -> 'KnnMatcher':
+        # classes_ of the classifier are the same sorted unique names.
+        _, self.labels = np.unique(np.asarray(y), return_inverse=True)
+        self.knn_clf = neighbors.KNeighborsClassifier(
+            n_neighbors=2, algorithm='ball_tree', weights='distance')
+        self.knn_clf.fit(x, y)
+        return self
+
+    def match(self, faces_encodings) -> List[str]:
+        if len(faces_encodings) == 0:
+            return []
+        if self.labels is None:
+            distances, _ = self.knn_clf.kneighbors(faces_encodings, n_neighbors=1)
+            return [str(name) if dist[0] <= self.threshold else 'unknown'
+                    for name, dist in zip(self.knn_clf.predict(faces_encodings), distances)]
+        # A single kneighbors query gives both the threshold and the vote.
+        distances, indices = self.knn_clf.kneighbors(
+            faces_encodings, n_neighbors=self.knn_clf.n_neighbors)
+        return vote(distances, self.labels[indices], self.knn_clf.classes_, self.threshold)
+
+    def save(self, path: str) -> None:
+        if path.endswith('.npz'):
+            raise ValueError(f'KNN models are pickled, {path} would not load as npz')
+        with open(path, 'wb') as f:
+            pickle.dump({'knn_clf': self.knn_clf, 'labels': self.labels,
+                         'threshold': self.threshold}, f)
+
 
-    # Determine how many neighbors to use for weighting in the KNN classifier
+class NumpyMatcher(Matcher):
+    '''Brute force nearest neighbors over a float32 matrix of known faces.
+    Distances of a batch of faces are computed with one matrix product.'''
+
+    kind = 'numpy'
     n_neighbors = 2
+    VERSION = 1
+
+    def __init__(self, threshold: float = 0.6) -> None:
+        super().__init__(threshold)
+        self.vectors = np.empty((0, 128), dtype=np.float32)
+        self.labels = np.empty(0, dtype=np.intp)
+        self.names = np.empty(0, dtype=str)
+
+    def fit(self, x, y) -> 'NumpyMatcher':
+        self.names, self.labels = np.unique(np.asarray(y), return_inverse=True)
+        self.vectors = np.asarray(x, dtype=np.float32)
+        return self
+
+    def match(self, faces_encodings, batch_size: int = 1024) -> List[str]:
+        if len(faces_encodings) == 0:
+            return []
+        k = min(self.n_neighbors, len(self.vectors))
+        norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        result = []
+        faces = np.asarray(faces_encodings, dtype=np.float32)
+        for start in range(0, len(faces), batch_size):
+            batch = faces[start:start + batch_size]
+            squared = norms[None, :] - 2 * batch @ self.vectors.T \
+                + np.einsum('ij,ij->i', batch, batch)[:, None]
+            nearest = np.argpartition(squared, k - 1, axis=1)[:, :k]
+            nearest_squared = np.take_along_axis(squared, nearest, axis=1)
+            order = np.argsort(nearest_squared, axis=1)
+            nearest = np.take_along_axis(nearest, order, axis=1)
+            distances = np.sqrt(np.maximum(np.take_along_axis(nearest_squared, order, axis=1), 0))
+            result.extend(vote(distances, self.labels[nearest], self.names, self.threshold))
+        return result
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            np.savez(f, version=self.VERSION, kind=self.kind, threshold=self.threshold,
+                     vectors=self.vectors, labels=self.labels, names=self.names)
+
+    @classmethod
+    def load(cls, data) -> 'NumpyMatcher':
+        matcher = cls(float(data['threshold']))
+        matcher.vectors = data['vectors']
+        matcher.labels = data['labels']
+        matcher.names = data['names']
+        return matcher
+
+
+class CentroidMatcher(NumpyMatcher):
+    '''Compares faces with the mean encoding of each person only.'''
+
+    kind = 'centroid'
+    n_neighbors = 1
+
+    def fit(self, x, y) -> 'CentroidMatcher':
+        super().fit(x, y)
+        sums = np.zeros((len(self.names), self.vectors.shape[1]))
+        np.add.at(sums, self.labels, self.vectors)
+        self.vectors = (sums / np.bincount(self.labels)[:, None]).astype(np.float32)
+        self.labels = np.arange(len(self.names))
+        return self
+
+
+MATCHERS = {cls.kind: cls for cls in (KnnMatcher, NumpyMatcher, CentroidMatcher)}
+
 
-    # Create and train the KNN classifier
-    knn_clf = neighbors.KNeighborsClassifier(
-        n_neighbors=n_neighbors, algorithm='ball_tree', weights='distance')
-    knn_clf.fit(x, y)
+def load_matcher(path: str) -> Matcher:
+    '''Loads a model saved by train, pickled KNN classifiers are still supported.
+    For the default MODEL_PATH, the most recently trained of it and
+    KNN_MODEL_PATH is loaded. Files named .npz are never unpickled.'''
+    if path == MODEL_PATH:
+        existing = [p for p in (MODEL_PATH, KNN_MODEL_PATH) if os.path.exists(p)]
+        if existing:
+            path = max(existing, key=os.path.getmtime)
+    if not zipfile.is_zipfile(path):
+        if path.endswith('.npz'):
+            raise ValueError(f'{path} is not a valid npz model')
+        with open(path, 'rb') as f:
+            model = pickle.load(f)
+        if isinstance(model, dict):
+            return KnnMatcher(model['knn_clf'], model['threshold'], model['labels'])
+        return KnnMatcher(model)
+    with np.load(path, allow_pickle=False) as data:
+        if int(data['version']) != NumpyMatcher.VERSION:
+            raise ValueError(f'Unsupported model version: {int(data["version"])}')
+        return MATCHERS[str(data['kind'])].load(data)
 
-    # Save the trained KNN classifier
-    with open(save_path, 'wb') as f:
-        pickle.dump(knn_clf, f)
 
-    return knn_clf
+def benchmark(store_path: str = 'embeddings', train_dir: str = 'dataset', holdout: int = 5):
+    '''Compares accuracy and latency of matchers on cached training encodings.
+    Every @holdout-th image of each person is used for testing.'''
+    store = EmbeddingStore(store_path)
+    x_train, y_train, x_test, y_test = [], [], [], []
+    seen = defaultdict(int)
+    for img_path, (_, _, row) in sorted(store.files.items()):
+        if row is None or not img_path.startswith(train_dir):
+            continue
+        name = os.path.basename(os.path.dirname(img_path))
+        seen[name] += 1
+        if seen[name] % holdout == 0:
+            x_test.append(store.vectors[row])
+            y_test.append(name)
+        else:
+            x_train.append(store.vectors[row])
+            y_train.append(name)
+    if not x_test:
+        print('Not enough cached encodings, train the model first.')
+        return
 
+    print(f'{"matcher":<10} {"accuracy":>9} {"fit (s)":>9} {"match (ms/face)":>16}')
+    for kind, cls in MATCHERS.items():
+        start = time.perf_counter()
+        matcher = cls().fit(x_train, y_train)
+        fitted = time.perf_counter()
+        names = matcher.match(np.asarray(x_test))
+        matched = time.perf_counter()
+        accuracy = np.mean([a == b for a, b in zip(names, y_test)])
+        print(f'{kind:<10} {accuracy:>9.3f} {fitted - start:>9.3f} '
+              f'{1000 * (matched - fitted) / len(x_test):>16.3f}')
 
-def predict(img_path: str, knn_clf) -> List[str]:
-    '''Recognizes faces in given image using a trained KNN classifier
+
+def predict(img_path: str, matcher) -> List[str]:
+    '''Recognizes faces in given image using a trained model
     @img_path: path for image file.
-    @knn_clf: Trained KNN model for prediction.'''
+    @matcher: Trained Matcher or KNN classifier for prediction.'''
+    if not isinstance(matcher, Matcher):
+        matcher = KnnMatcher(matcher)
+    return matcher.match(encode_faces(img_path))
 
-    # Load image file and find face locations
-    image = face_recognition.load_image_file(img_path)
-    face_locations = face_recognition.face_locations(image)
 
-    # If no faces are found in the image, return an empty result.
-    if len(face_locations) == 0:
-        return []
+def destinations(matcher: Matcher, folder: str, batch: List[Tuple[str, list]]) -> List[Tuple[str, str]]:
+    '''Matches faces of a batch of (img_path, encodings) at once and returns
+    (img_path, dest_dir) for each image.'''
+    names = matcher.match([face for _, faces in batch for face in faces])
+    result = []
+    for img_path, faces in batch:
+        image_names, names = names[:len(faces)], names[len(faces):]
+        result.append((img_path, join(folder, '_'.join(sorted(set(image_names))))))
+    return result
 
-    # Find encodings for faces in the test iamge
-    faces_encodings = face_recognition.face_encodings(
-        image, known_face_locations=face_locations)
 
-    # Use the KNN model to find the best matches for the test face
-    closest_distances = knn_clf.kneighbors(faces_encodings, n_neighbors=1)
-    are_matches = [closest_distances[0][i][0] <=
-                   0.6 for i in range(len(face_locations))]
+def move_image(img_path: str, dest: str) -> bool:
+    try:
+        os.makedirs(dest, exist_ok=True)
+        shutil.move(img_path, join(dest, os.path.basename(img_path)))
+    except OSError as e:
+        print(f'\nCould not move {img_path}: {e}')
+        return False
+    return True
 
-    # Predict classes and remove classifications that aren't within the threshold
-    return [pred if rec else "unknown" for pred, _, rec in zip(knn_clf.predict(faces_encodings), face_locations, are_matches)]
+
+def move_images(moves: 'queue.Queue', on_moved) -> None:
+    '''Moves (img_path, dest_dir) pairs from queue until None is received,
+    on_moved(img_path) is called after each move.'''
+    while True:
+        item = moves.get()
+        if item is None:
+            break
+        if move_image(*item):
+            on_moved(item[0])
 
 
-def organize(trained_model: str = 'trained_model.pik'):
+def organize(trained_model: str = MODEL_PATH, jobs: Optional[int] = None,
+             folder: str = 'organize', batch_size: int = 64, face_cache: Optional[FaceCache] = None):
+    '''Moves each image in folder into a sub folder named after the people in it.
+    Images are encoded on @jobs processes, faces of @batch_size images are
+    matched together and moves run on a separate thread. Predicted moves are
+    written to a journal in folder, so an interrupted run resumes without
+    encoding those images again. Images found in @face_cache are not decoded.'''
     utils.clear_screen()
     print('Loading trained model...')
-    with open(trained_model, 'rb') as f:
-        knn_clf = pickle.load(f)
+    matcher = load_matcher(trained_model)
     print('Load complete.')
     print('Organizing Files...')
-    images = image_files_in_folder('organize')
-    images_len = len(images)
-    for i, img_path in enumerate(images):
-        print(f'Processing: {i+1}/{images_len}\r', end='')
-        names = predict(img_path, knn_clf)
-        names = list(set(names))  # removing duplicate names
-        name = '_'.join(names)
-        dest = join('organize', name)
-        if not os.path.exists(dest):
-            os.mkdir(dest)
-        shutil.move(img_path, join(dest, os.path.basename(img_path)))
-    print()
+
+    journal_path = join(folder, '.organize.journal')
+    planned = {}
+    if os.path.exists(journal_path):
+        with open(journal_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record['state'] == 'planned':
+                    planned[record['file']] = record['dest']
+                else:
+                    planned.pop(record['file'], None)
+
+    journal = open(journal_path, 'a')
+    journal_lock = threading.Lock()
+
+    def record(**fields):
+        with journal_lock:
+            journal.write(json.dumps(fields) + '\n')
+            journal.flush()
+
+    moves = queue.Queue(maxsize=4 * batch_size)
+    mover = threading.Thread(target=move_images,
+                             args=(moves, lambda img_path: record(state='done', file=img_path)))
+    mover.start()
+
+    def flush(batch):
+        for img_path, dest in destinations(matcher, folder, batch):
+            record(state='planned', file=img_path, dest=dest)
+            moves.put((img_path, dest))
+
+    try:
+        for img_path, dest in planned.items():
+            if os.path.exists(img_path):
+                moves.put((img_path, dest))
+        images = [path for path in image_files_in_folder(folder) if path not in planned]
+        batch = []
+        for img_path, faces in encode_images(images, jobs, face_cache):
+            batch.append((img_path, faces))
+            if len(batch) == batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        moves.put(None)
+        mover.join()
+        journal.close()
+    os.remove(journal_path)
     print('Organization complete.')
     utils.pause()
 
 
+IMAGE_RE = re.compile(r'.*\.(jpg|jpeg|png)$', re.IGNORECASE)
+
+
+class Inotify:
+    '''Minimal Linux inotify reader for files written or moved into a folder.'''
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, folder: str) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init failed')
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder),
+                                  self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed')
+
+    def read(self, timeout: float) -> List[str]:
+        '''Returns names of files changed within timeout seconds.'''
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        names = []
+        offset = 0
+        while offset < len(data):
+            *_, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            names.append(os.fsdecode(data[offset:offset + length].rstrip(b'\0')))
+            offset += length
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def watch_images(folder: str, ready: 'queue.Queue', stop: threading.Event,
+                 debounce: float = 2.0, interval: float = 1.0, rescan: float = 60.0) -> None:
+    '''Puts paths of images arriving in folder into ready queue until stop is set.
+    An image is ready once its size and mtime did not change for @debounce
+    seconds, so partially written files are skipped. Uses inotify when it is
+    available and rescans folder every @rescan seconds in case events were
+    lost, otherwise folder is polled every @interval seconds.'''
+    try:
+        inotify = Inotify(folder)
+    except (OSError, AttributeError, TypeError):
+        inotify = None
+        rescan = interval
+
+    pending = {}  # path -> (size, mtime_ns, time of last change)
+    queued = set()
+    last_scan = 0
+
+    def add(name):
+        path = join(folder, name)
+        if IMAGE_RE.match(name) and path not in queued and path not in pending:
+            pending[path] = (None, None, time.time())
+
+    try:
+        while not stop.is_set():
+            if inotify:
+                for name in inotify.read(interval):
+                    add(name)
+            else:
+                stop.wait(interval)
+            if time.time() - last_scan >= rescan:
+                names = set(os.listdir(folder))
+                queued = {path for path in queued if os.path.basename(path) in names}
+                for name in names:
+                    add(name)
+                last_scan = time.time()
+
+            now = time.time()
+            for path, (size, mtime, changed) in list(pending.items()):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    del pending[path]
+                    continue
+                if (st.st_size, st.st_mtime_ns) != (size, mtime):
+                    pending[path] = (st.st_size, st.st_mtime_ns, now)
+                elif now - changed >= debounce:
+                    del pending[path]
+                    queued.add(path)
+                    ready.put((path, now))  # blocks while workers are behind
+    finally:
+        if inotify:
+            inotify.close()
+
+
+def watch(trained_model: str = MODEL_PATH, jobs: Optional[int] = None,
+          folder: str = 'organize', batch_size: int = 16, queue_size: int = 256,
+          face_cache: Optional[FaceCache] = None, stats_interval: float = 60.0):
+    '''Organizes images as they arrive in folder until interrupted.
+    Model and worker processes are loaded once, ready images are taken from a
+    queue of at most @queue_size images in batches of up to @batch_size, and a
+    throughput and latency line is printed every @stats_interval seconds.
+    Images that can't be read or decoded are logged and skipped.'''
+    print('Loading trained model...')
+    matcher = load_matcher(trained_model)
+    print(f'Watching {folder}...')
+    ready = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    watcher = threading.Thread(target=watch_images, args=(folder, ready, stop), daemon=True)
+    watcher.start()
+
+    processed = 0
+    latency = 0.0
+    window_start = time.time()
+    encode = partial(try_encode_faces, cache=face_cache)
+    with Pool(jobs or os.cpu_count() or 1) as pool:
+        try:
+            while True:
+                batch = []
+                try:
+                    batch.append(ready.get(timeout=1))
+                    while len(batch) < batch_size:
+                        batch.append(ready.get_nowait())
+                except queue.Empty:
+                    pass
+
+                if batch:
+                    paths = [path for path, _ in batch]
+                    encoded = []
+                    for img_path, (encodings, error) in zip(paths, pool.map(encode, paths)):
+                        if error is None:
+                            encoded.append((img_path, encodings))
+                        else:
+                            print(f'Skipping {img_path}: {error}', flush=True)
+                    for img_path, dest in destinations(matcher, folder, encoded):
+                        move_image(img_path, dest)
+                    now = time.time()
+                    processed += len(batch)
+                    latency += sum(now - arrived for _, arrived in batch)
+
+                elapsed = time.time() - window_start
+                if elapsed >= stats_interval:
+                    average = latency / processed if processed else 0
+                    print(f'[{time.strftime("%H:%M:%S")}] {processed} image(s), '
+                          f'{processed / elapsed:.2f} images/s, {average:.2f}s avg latency, '
+                          f'{ready.qsize()} queued', flush=True)
+                    if face_cache:
+                        face_cache.evict()
+                    processed = 0
+                    latency = 0.0
+                    window_start = time.time()
+        finally:
+            stop.set()
+
+
 def help():
     utils.clear_screen()
     structure_help = '''STEP 1: Label your training images using following structure.
@@ -126,6 +749,37 @@ STEP 2: Place unorganized images into 'organize' folder.
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Organize images by the faces in them.')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Number of processes used for encoding images, defaults to number of cpus')
+    parser.add_argument('--model', type=str, default=None,
+                        help=f'Path of the trained model, pickled KNN models are also accepted. '
+                             f'Defaults to {MODEL_PATH} or {KNN_MODEL_PATH}, whichever was trained last')
+    parser.add_argument('--matcher', choices=list(MATCHERS), default='numpy',
+                        help='Kind of model to train')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Compare matchers on cached training encodings and exit')
+    parser.add_argument('--watch', action='store_true',
+                        help='Run headless and organize images as they arrive in the organize folder')
+    parser.add_argument('--face-cache', type=str, default='.face_cache',
+                        help='Directory of cached face detections, empty to disable')
+    parser.add_argument('--face-cache-size', type=int, default=256,
+                        help='Maximum size of the face cache in MB')
+    args = parser.parse_args()
+    face_cache = FaceCache(args.face_cache, args.face_cache_size * 1024 * 1024) \
+        if args.face_cache else None
+
+    if args.watch:
+        try:
+            watch(args.model or MODEL_PATH, args.jobs, face_cache=face_cache)
+        except KeyboardInterrupt:
+            pass
+        exit(0)
+
+    if args.benchmark:
+        benchmark()
+        exit(0)
+
     items = ['Train Dataset', 'Organize Files', 'Help', 'Exit']
     commands = ('quit', 'exit')
     while True:
@@ -133,11 +787,12 @@ if __name__ == "__main__":
         if choice in items:
             index = items.index(choice)
             if index == 0:
-                print("Training KNN classifier...")
-                train()
+                print("Training classifier...")
+                train(save_path=args.model, jobs=args.jobs, matcher=args.matcher,
+                      face_cache=face_cache)
                 print("Training complete!")
             elif index == 1:
-                organize()
+                organize(args.model or MODEL_PATH, jobs=args.jobs, face_cache=face_cache)
             elif index == 2:
                 help()
             else:
@@ -1,48 +1,123 @@
 '''A simple Python menu-based UI system for terminal applications.'''
 
 from .utils import clear_screen, display, find
-from typing import Tuple, List
+from shutil import get_terminal_size
+from typing import Iterable, Optional, Tuple, List
+
+
+class _Pages:
+    '''Splits options into pages that fit the terminal and tracks the shown one.'''
+
+    def __init__(self, options: Tuple[str], page_size: Optional[int] = None) -> None:
+        self.options = options
+        self.size = page_size or max(get_terminal_size().lines - 8, 5)
+        self.count = max((len(options) + self.size - 1) // self.size, 1)
+        self.page = 0
+
+    def rows(self) -> range:
+        '''Indices of options on current page.'''
+        start = self.page * self.size
+        return range(start, min(start + self.size, len(self.options)))
+
+    def show(self, header: Optional[str], label=None) -> None:
+        '''Prints only the current page, @label(index) is appended to each option.'''
+        clear_screen()
+        if header:
+            print(header)
+        rows = self.rows()
+        width = max((len(str(self.options[i])) for i in rows), default=0)
+        for i in rows:
+            option = str(self.options[i])
+            if label is None:
+                print(f'[{i + 1}] {option}')
+            else:
+                print(f'[{i + 1}] {option} {" " * (width - len(option))} [{label(i)}]')
+        if self.count > 1:
+            print(f'Page {self.page + 1}/{self.count}: [n] Next  [p] Previous  [/text] Search')
+
+    def navigate(self, choice: str) -> bool:
+        '''Handles page commands, returns False if choice is not one of them.'''
+        if self.count == 1:
+            return False
+        if choice == 'n':
+            self.page = (self.page + 1) % self.count
+        elif choice == 'p':
+            self.page = (self.page - 1) % self.count
+        elif choice.startswith('/') and len(choice) > 1:
+            index = self.search(choice[1:])
+            if index == -1:
+                display(f'No option contains {choice[1:]!r}')
+            else:
+                self.page = index // self.size
+        else:
+            return False
+        return True
+
+    def search(self, text: str) -> int:
+        '''Returns index of first option containing text after the current page,
+        wrapping around to the start, or -1.'''
+        text = text.lower()
+        total = len(self.options)
+        start = self.rows().stop
+        for n in range(total):
+            i = (start + n) % total
+            if text in str(self.options[i]).lower():
+                return i
+        return -1
+
+
+def _parse_numbers(choice: str, size: int) -> Optional[range]:
+    '''Parses "3" or "3-40" into a range of option indices, None if invalid.'''
+    first, sep, last = choice.partition('-')
+    if not first.strip().isdigit() or (sep and not last.strip().isdigit()):
+        return None
+    first = int(first)
+    last = int(last) if sep else first
+    if not 1 <= first <= last <= size:
+        return None
+    return range(first - 1, last)
 
 
 def choose(options: Tuple[str], msg: str = 'Enter your choice: ', header: str = None,
-           commands: Tuple[str] = ()) -> str:
+           commands: Tuple[str] = (), page_size: Optional[int] = None) -> str:
     '''Persistently asks user to choose an option from given list.
+    Options that don't fit the terminal are split into pages.
 
     ### Parameters
     @options: list of values that user have to choose from.
     @msg: will be passed to python's input().
     @commands: these are not displayed but if user enters them then it'll be returned.
     @header: if provided then it will be displayed before options.
+    @page_size: options shown per page, by default as many as fit the terminal.
 
     ### Returns
     Returns the option that was selected.
     '''
-    clear_screen()
     size = len(options)
+    pages = _Pages(options, page_size)
 
-    if header:
-        print(header)
-    for i, option in enumerate(options):
-        print(f'[{i + 1}] {option}')
-    choice = input(msg)
+    while True:
+        pages.show(header)
+        choice = input(msg)
 
-    if choice in commands:
-        return choice
-    if not choice.isdigit():
-        display(f'Enter a number between 1 and {size}')
-        return choose(options, msg, header)
-    choice = int(choice)
-    if choice < 1 or choice > size:
-        display(f'Enter a number between 1 and {size}')
-        return choose(options, msg, header)
+        if choice in commands:
+            return choice
+        if pages.navigate(choice):
+            continue
+        if not choice.isdigit() or not 1 <= int(choice) <= size:
+            display(f'Enter a number between 1 and {size}')
+            continue
 
-    return options[choice - 1]
+        return options[int(choice) - 1]
 
 
 def select(options: Tuple[str], msg: str = 'Enter your choice: ', header: str = None,
-           commands: Tuple[str] = (), default_selections: Tuple[str] = (),
-           min_selection: int = 1, max_selection: int = -1) -> List[str]:
+           commands: Tuple[str] = (), default_selections: Iterable[str] = (),
+           min_selection: int = 1, max_selection: int = -1,
+           page_size: Optional[int] = None) -> List[str]:
     '''Persistently asks user to select one or more option from given list.
+    A number or a range like 3-40 toggles those options, options that don't
+    fit the terminal are split into pages.
 
     ### Parameters
     @options: list of values that user have to choose from.
@@ -52,77 +127,67 @@ def select(options: Tuple[str], msg: str = 'Enter your choice: ', header: str =
     @default_selections: these options will be selected by default.
     @min_selection: minimum number of selections required.
     @max_selection: maximum number of selections that can be made. default -1 for all.
+    @page_size: options shown per page, by default as many as fit the terminal.
 
     ### Returns
-    Returns list of options that were selected.
+    Returns list of options that were selected, in the order they were selected.
     '''
-    choices = []
-    choices.extend(default_selections)
+    size = len(options)
     if max_selection == -1:
-        max_selection = len(options)
+        max_selection = size
 
-    def is_selected(option: str):
-        return 'Selected' if option in choices else 'Not Selected'
-
-    def get_spacing(options: str):
-        str_options = list(map(str, options))
-        spacing = []
-        max_chars = len(max(str_options, key=len))
-        for option in str_options:
-            spacing.append(max_chars - len(option))
-        return spacing
+    # Indices of selected options, a dict keeps them in selection order.
+    index = {}
+    for i, option in enumerate(options):
+        index.setdefault(option, i)
+    chosen = dict.fromkeys(index[option] for option in default_selections if option in index)
 
-    spacing = get_spacing(options)
+    pages = _Pages(options, page_size)
     while True:
-        clear_screen()
-        size = len(options)
-
-        if header:
-            print(header)
-        for i, option in enumerate(options):
-            print(f'[{i + 1}] {option} {" " * spacing[i]} [{is_selected(option)}]')
+        pages.show(header, lambda i: 'Selected' if i in chosen else 'Not Selected')
         print()
+        print(f'{len(chosen)} of {size} selected')
         print(f'[a] Select All')
         print(f'[b] Select None')
         print(f'[c] Continue')
         choice = input(msg)
 
         if choice == 'a':
-            i = 0
-            while len(choices) < min(max_selection, len(options)):
-                if options[i] not in choices:
-                    choices.append(options[i])
-                i += 1
+            for i in range(size):
+                if len(chosen) >= max_selection:
+                    break
+                chosen[i] = None
             continue
         if choice == 'b':
-            choices.clear()
+            chosen.clear()
             continue
         if choice == 'c':
-            if len(choices) < min_selection:
+            if len(chosen) < min_selection:
                 display(
                     f'You have to select at least {min_selection} to continue.')
                 continue
             break
         if choice in commands:
             return choice
-        if not choice.isdigit():
-            display(f'Enter a number between 1 and {size}')
+        if pages.navigate(choice):
             continue
-        choice = int(choice)
-        if choice < 1 or choice > size:
-            display(f'Enter a number between 1 and {size}')
+        numbers = _parse_numbers(choice, size)
+        if numbers is None:
+            display(f'Enter a number or a range between 1 and {size}')
             continue
 
-        choice = options[choice - 1]
-        if choice not in choices and len(choices) == max_selection:
-            display(f'You can\'t select more than {len(choices)} options')
+        # A range that is fully selected is deselected, otherwise all of it is selected.
+        added = [i for i in numbers if i not in chosen]
+        if not added:
+            for i in numbers:
+                del chosen[i]
             continue
-        if choice in choices:
-            choices.remove(choice)
-        else:
-            choices.append(choice)
+        if len(chosen) + len(added) > max_selection:
+            display(f'You can\'t select more than {max_selection} options')
+            continue
+        chosen.update(dict.fromkeys(added))
 
-    return choices
+    return [options[i] for i in chosen]
 
 
 def confirm(msg: str = 'Do you want to continue?', options: Tuple[str] = ('Y', 'N'), commands: Tuple[str] = (), ignore_case: bool = True) -> str: